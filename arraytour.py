@@ -0,0 +1,49 @@
+from tour import Tour
+from twolevel import TwoLevelList
+
+
+class ArrayTour(Tour):
+    """ A Tour keeping the cities order in a two-level list
+        instead of the neighbors dictionary, so that flipping the
+        direction of a part of the path costs O(sqrt(N))
+        instead of the number of cities in that part.
+
+        In the LK path state the cities stay on a cycle in the list ;
+        the missing road is the one from self.last to self.first.
+    """
+
+    def init_order(self, cities):
+        self.order = TwoLevelList(cities)
+
+    def replace_neighbors(self, road, (a, b)):
+        """ Nothing to do, the path ends are only kept in self.first and self.last. """
+        pass
+
+    def flip_direction(self, cityA=None, cityB=None):
+        if cityA is not None:
+            self.order.reverse(cityA, cityB)
+        else:
+            self.order.flip()
+            (self.first, self.last) = (self.last, self.first)
+
+    def link_city(self, city, a, b):
+        self.order.insert(city, a)
+
+    def unlink_city(self, city, a, b):
+        self.order.remove(city)
+
+    def next_city(self, city):
+        if city == self.last:
+            return None
+        return self.order.next(city)
+
+    def prev_city(self, city):
+        if city == self.first:
+            return None
+        return self.order.prev(city)
+
+    def between(self, a, b, c):
+        return self.order.between(a, b, c)
+
+    def cities_from(self, start):
+        return self.order.sequence(start)
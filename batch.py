@@ -0,0 +1,78 @@
+""" Solve many instances in one go :
+
+    python batch.py instances/ -o results.jsonl
+    python batch.py instances.jsonl -w 4 -c 5 --candidate-type alpha
+
+The instances are the csv and TSPLIB files of a directory, or the lines of
+a JSONL file ({"id": ..., "coords": [[x, y], ...]} with optional "names",
+"metric" and "options").  They are solved on a pool of processes, and the
+result of each one is written as a JSON line as soon as it is done.
+"""
+import sys
+import json
+import argparse
+from construction import tour_builders
+from preopt import pre_optimizers
+from lk import breadth_list
+from solver import solve_batch, solve_defaults
+
+parser = argparse.ArgumentParser(description='Lin Kernighan Algorithm on a batch of instances.')
+parser.add_argument('source', help='Directory of csv or TSPLIB files, or JSONL file of instances.')
+parser.add_argument('-o', '--output', default=None,
+                    help='File to write the results to, one JSON line per instance, default the standard output.')
+parser.add_argument('-w', '--workers', type=int, default=None,
+                    help='Number of processes, each one solving an instance at a time, default one per CPU.')
+parser.add_argument('-n', '--neighbors', type=int, default=solve_defaults['neighbors'],
+                    help='Neighbors count to test for new roads, default %(default)s.')
+parser.add_argument('-c', '--candidates', type=int, default=solve_defaults['candidates'],
+                    help='Candidate roads kept for each city, default %(default)s.')
+parser.add_argument('--candidate-type', choices=['nearest', 'alpha'], default=solve_defaults['candidate_type'],
+                    help='Nearest or alpha-nearest candidate roads, default %(default)s.')
+parser.add_argument('-i', '--init', choices=sorted(tour_builders), default='greedy',
+                    help='Heuristic building the initial tour, default greedy, unlike solve() and tsp.py '
+                         '(random) : without --depth, the first path searches from a random tour of a '
+                         'few hundred cities can take minutes.')
+parser.add_argument('--pre-opt', choices=sorted(pre_optimizers), default=None,
+                    help='Improve the initial tour with NumPy vectorized 2-opt and/or Or-opt moves.')
+parser.add_argument('--tile-size', type=int, default=None,
+                    help='Solve the instances larger than this by tiles of at most this many cities.')
+parser.add_argument('-b', '--backend', choices=['linked', 'array'], default=solve_defaults['backend'],
+                    help='Tour order storage, default %(default)s.')
+parser.add_argument('-d', '--depth', type=int, default=None,
+                    help='Depth of search, if given a fixed lambda-opt search.')
+parser.add_argument('--transpositions', type=int, default=solve_defaults['transpositions'],
+                    help='Size of the transposition table of the recursive search, default %(default)s, no table.')
+parser.add_argument('--search', choices=['recursive', 'iterative'], default=solve_defaults['search'],
+                    help='Path search, the recursive path_search (default) or its iterative version.')
+parser.add_argument('--breadth', type=breadth_list, default=None,
+                    help='Modifications tried at each depth by the iterative search, as 5,5,3,2,1.')
+parser.add_argument('--first-improvement', action='store_true',
+                    help='Stop the iterative search at the first improvement.')
+parser.add_argument('-t', '--time-limit', type=float, default=None,
+                    help='Time in seconds for each instance, spent improving the tour with the first LK pass and '
+                         'the iterated LK kicks after it, in all.')
+parser.add_argument('-m', '--max-trials', type=int, default=None,
+                    help='Maximum number of iterated LK kicks for each instance.')
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='Seed of the random generator, set again for each instance.')
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.transpositions and args.search == 'iterative':
+        parser.error("--transpositions only applies to --search recursive.")
+    options = vars(args)
+    (source, output, workers) = (options.pop('source'), options.pop('output'), options.pop('workers'))
+    results = open(output, 'w') if output else sys.stdout
+    (solved, failed) = (0, 0)
+    for result in solve_batch(source, workers, **options):
+        results.write(json.dumps(result) + "\n")
+        results.flush()
+        if 'error' in result:
+            failed += 1
+            sys.stderr.write("%s : %s\n" % (result['id'], result['error']))
+        else:
+            solved += 1
+    if output:
+        results.close()
+    sys.stderr.write("%i instances solved, %i failed.\n" % (solved, failed))
@@ -0,0 +1,230 @@
+""" Benchmarks of tour_improve on generated instances.
+
+    python benchmarks/bench.py run -o results.json
+    python benchmarks/bench.py compare baseline.json results.json
+
+'run' solves each instance (kind, size, seed) with each neighbors and depth
+setting, every case in a new process so that its peak memory is its own,
+and writes the wall time, peak RSS, path_search nodes (per depth and in
+all) and tour length of each case to a JSON file ; it exits with status 1 if
+the process of a case died, the other cases being written.  The 100000 cities
+instances are only run with --large.  With --trials, the tour is then
+kicked and repaired that many times by iterated LK.  With --workers 0 and
+other counts, the speedup of the TourPool over the search in one process
+is printed for each case, as with "-i random -N 1000 -d 4 -w 0 4".
+'compare' matches the cases of two such files and flags the ones which
+got slower, bigger or longer than the tolerances ; it exits with status 1
+if any case regressed, so it can be used in a script.
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import platform
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from instances import generators
+from tour import Tour
+from arraytour import ArrayTour
+from problem import Problem
+from stats import SearchStats
+from lk import tour_improve
+from ils import IteratedLK
+from parallel import TourPool
+from construction import tour_builders, build_tour
+
+# The settings identifying a case ; compare matches cases on them.
+case_keys = ('kind', 'size', 'seed', 'neighbors', 'depth', 'candidates', 'init', 'backend', 'workers', 'trials')
+
+# The value of the case keys missing from results written before they were added.
+key_defaults = {'trials': 0}
+
+# The size of the instances added by --large.
+large_size = 100000
+
+
+def run_case(case):
+    """ Solve one instance with one setting ; return the case with its results.
+        The path_search nodes are counted at each depth by the SearchStats
+        of the tour, whether the searches run here or on the workers. """
+    random.seed(case['seed'])
+    cities = generators[case['kind']](case['size'], case['seed'])
+    tour_class = ArrayTour if case['backend'] == 'array' else Tour
+    begin = time.time()
+    roads = Tour.candidate_roads(cities, max(case['candidates'], case['neighbors']))
+    problem = Problem(cities, roads, SearchStats())
+    tour = build_tour(case['init'], cities, tour_class, problem)
+    initial_length = tour.tour_length()
+    start = time.time()
+    if case['workers']:
+        pool = TourPool(cities, tour_class, case['workers'], problem)
+        pool.tour_improve(tour, case['neighbors'], False, case['depth'], quiet=True)
+        pool.close()
+    else:
+        tour_improve(tour, case['neighbors'], False, case['depth'], quiet=True)
+    if case['trials']:
+        ils = IteratedLK(tour, case['neighbors'], case['depth'], rng=random.Random(case['seed']))
+        tour = ils.run(max_trials=case['trials'], quiet=True)
+    end = time.time()
+    result = dict(case)
+    result.update({
+        'setup_time': start - begin,
+        'improve_time': end - start,
+        'time': end - begin,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'path_search_nodes': problem.stats.nodes,
+        'path_searches': sum(problem.stats.nodes),
+        'initial_length': initial_length,
+        'length': tour.tour_length(),
+    })
+    return result
+
+
+def _send_case(case, sender):
+    sender.send(run_case(case))
+
+
+def run_isolated(case):
+    """ Run the case in a new process, so that its peak RSS doesn't include
+        the previous cases, and return its results, or None if the process
+        died before sending them.  This is not a pool process, so that it
+        can start its own pool of workers. """
+    (receiver, sender) = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=_send_case, args=(case, sender))
+    process.start()
+    # Only the child keeps the sending end open, so recv fails when it dies.
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        print "%(kind)s %(size)i seed %(seed)i, neighbors %(neighbors)i, depth %(depth)s : " \
+              "failed, exit code %(exitcode)s" % dict(case, exitcode=process.exitcode)
+    return result
+
+
+def speedups(results):
+    """ Print the speedup of the tour_improve time of each case run on
+        workers over the same case run in one process, if it was run. """
+    serial = dict((key(dict(case, workers=None)), case) for case in results if not case['workers'])
+    for case in results:
+        base = serial.get(key(dict(case, workers=None)))
+        if case['workers'] and base is not None:
+            print "%(kind)s %(size)i seed %(seed)i, neighbors %(neighbors)i, depth %(depth)s, " \
+                  "%(workers)i workers :" % case, \
+                  "speedup %.2f" % (base['improve_time'] / case['improve_time'] if case['improve_time'] else 0)
+
+
+def key(case):
+    return tuple(case.get(k, key_defaults.get(k)) for k in case_keys)
+
+
+def run(args):
+    sizes = args.sizes + [large_size] if args.large else args.sizes
+    cases = [dict(kind=kind, size=size, seed=seed, neighbors=neighbors, depth=depth, candidates=args.candidates,
+                  init=args.init, backend=args.backend, workers=workers or None, trials=args.trials)
+             for kind in args.kinds for size in sizes for seed in args.seeds
+             for neighbors in args.neighbors for depth in args.depths for workers in args.workers]
+    results = []
+    failed = 0
+    for case in cases:
+        result = run_isolated(case)
+        if result is None:
+            failed += 1
+            continue
+        print "%(kind)s %(size)i seed %(seed)i, neighbors %(neighbors)i, depth %(depth)s : " \
+              "%(time).2f s, %(max_rss_kb)i KB, %(path_searches)i path_search nodes, length %(length).0f" % result
+        results.append(result)
+    with open(args.output, 'w') as output:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results},
+                  output, indent=1, sort_keys=True)
+    speedups(results)
+    print "Results written to %s" % args.output
+    if failed:
+        print "%i case(s) failed" % failed
+        return 1
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = dict((key(case), case) for case in json.load(f)['results'])
+    with open(args.results) as f:
+        results = json.load(f)['results']
+    checks = (('time', args.time_tolerance), ('max_rss_kb', args.memory_tolerance),
+              ('length', args.length_tolerance))
+    regressions = 0
+    for case in results:
+        base = baseline.get(key(case))
+        name = "%(kind)s %(size)i seed %(seed)i, neighbors %(neighbors)i, depth %(depth)s" % case
+        if base is None:
+            print "%s : not in the baseline" % name
+            continue
+        changes = []
+        for (measure, tolerance) in checks:
+            ratio = case[measure] / float(base[measure]) if base[measure] else 1.0
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = ' REGRESSION'
+                regressions += 1
+            changes.append("%s %+.1f%%%s" % (measure, 100 * (ratio - 1), flag))
+        changes.append("path_search nodes %i -> %i" % (base['path_searches'], case['path_searches']))
+        print "%s : %s" % (name, ", ".join(changes))
+    print "%i regression(s) in %i cases" % (regressions, len(results))
+    return 1 if regressions else 0
+
+
+parser = argparse.ArgumentParser(description='Benchmarks of the Lin Kernighan search.')
+commands = parser.add_subparsers()
+parser_run = commands.add_parser('run', help='Run the benchmarks and write the results.')
+parser_run.add_argument('-k', '--kinds', nargs='+', choices=sorted(generators), default=['uniform', 'clustered'],
+                        help='Kinds of generated instances, default both.')
+parser_run.add_argument('-N', '--sizes', nargs='+', type=int, default=[1000, 10000],
+                        help='Numbers of cities, default 1000 10000.')
+parser_run.add_argument('--large', action='store_true',
+                        help='Also run the %i cities instances, which take minutes each.' % large_size)
+parser_run.add_argument('-s', '--seeds', nargs='+', type=int, default=[1],
+                        help='Seeds of the generated instances, default 1.')
+parser_run.add_argument('-n', '--neighbors', nargs='+', type=int, default=[3, 5],
+                        help='Neighbors counts to test for new roads, default 3 5.')
+parser_run.add_argument('-d', '--depths', nargs='+', type=int, default=[4, 6],
+                        help='Depths of search, default 4 6.')
+parser_run.add_argument('-c', '--candidates', type=int, default=10,
+                        help='Nearest neighbors kept as candidate roads, default 10.')
+parser_run.add_argument('-i', '--init', choices=sorted(tour_builders), default='greedy',
+                        help='Heuristic building the initial tour, default greedy.')
+parser_run.add_argument('-b', '--backend', choices=['linked', 'array'], default='array',
+                        help='Tour order storage, default array.')
+parser_run.add_argument('-w', '--workers', nargs='+', type=int, default=[0],
+                        help='Numbers of processes to run the path searches in rounds on, 0 for one at a time '
+                             'in the benchmark process, default 0 ; with 0 and others, the speedup over 0 '
+                             'of each case is printed.')
+parser_run.add_argument('-t', '--trials', type=int, default=0,
+                        help='Iterated LK kicks after the LK pass, default 0. '
+                             '-k uniform -N 2000 -n 3 -d 4 -s 2 7 -t 3000 checks that the moves of no gain '
+                             'on tours of length 1e7 and more are not taken again and again.')
+parser_run.add_argument('-o', '--output', default='results.json',
+                        help='JSON file to write the results to, default results.json.')
+parser_run.set_defaults(command=run)
+parser_compare = commands.add_parser('compare', help='Compare results with a baseline.')
+parser_compare.add_argument('baseline', help='JSON results of the reference run.')
+parser_compare.add_argument('results', help='JSON results to check.')
+parser_compare.add_argument('--time-tolerance', type=float, default=0.1,
+                            help='Relative slowdown flagged as a regression, default 0.1.')
+parser_compare.add_argument('--memory-tolerance', type=float, default=0.1,
+                            help='Relative peak RSS increase flagged as a regression, default 0.1.')
+parser_compare.add_argument('--length-tolerance', type=float, default=1e-6,
+                            help='Relative tour length increase flagged as a regression, default 1e-6.')
+parser_compare.set_defaults(command=compare)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sys.exit(args.command(args))
@@ -0,0 +1,36 @@
+import random
+from math import sqrt
+from cities import Cities
+
+# Seeded random instances for the benchmarks, in the style of the DIMACS
+# TSP challenge generators : integer coordinates in a square of side 10^6.
+
+side = 1000000
+
+
+def uniform(n, seed):
+    """ n cities uniformly distributed in the square. """
+    rng = random.Random(seed)
+    x = [rng.randint(0, side - 1) for i in range(n)]
+    y = [rng.randint(0, side - 1) for i in range(n)]
+    return Cities([str(i) for i in range(n)], x, y)
+
+
+def clustered(n, seed):
+    """ n cities around n/100 centers uniformly distributed in the square,
+        normally distributed around them with deviation side/sqrt(n). """
+    rng = random.Random(seed)
+    centers = [(rng.uniform(0, side), rng.uniform(0, side)) for i in range(max(1, n // 100))]
+    sigma = side / sqrt(n)
+    (x, y) = ([], [])
+    for i in range(n):
+        (cx, cy) = rng.choice(centers)
+        x.append(int(round(rng.gauss(cx, sigma))))
+        y.append(int(round(rng.gauss(cy, sigma))))
+    return Cities([str(i) for i in range(n)], x, y)
+
+
+generators = {
+    'uniform': uniform,
+    'clustered': clustered,
+}
@@ -0,0 +1,105 @@
+import os
+import json
+import hashlib
+import numpy
+from roads import Roads
+
+# Changed when the cache format or the candidates order changes,
+# so that the entries made before are not used anymore.
+cache_version = 1
+
+
+class CandidateCache(object):
+    """ A directory of candidate roads already computed, so that running
+        again the same instance with the same candidates count skips the
+        KD-tree and all the distance computations of the Roads sorting.
+
+        An entry is named by the hash of the coordinates, the metric,
+        the candidates count and kind : <key>.npy is the start array of
+        the Roads followed by its others array, memory-mapped when read,
+        and <key>.json tells their sizes and checksum (and the lower bound
+        of the alpha-nearness candidates).  An entry which
+        doesn't match them is ignored and removed.
+
+        The modification time of an entry is updated when it is used ;
+        when the entries take more than max_bytes, the least recently
+        used ones are removed.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, cities, count, kind='nearest'):
+        digest = hashlib.sha1()
+        (x, y) = cities.arrays()
+        digest.update(x.tostring())
+        digest.update(y.tostring())
+        digest.update("%s %s %s %i" % (cities.metric, count, kind, cache_version))
+        return digest.hexdigest()
+
+    def paths(self, key):
+        path = os.path.join(self.directory, key)
+        return path + '.npy', path + '.json'
+
+    def get(self, cities, count, kind='nearest'):
+        """ Return the cached Roads of the cities, or None. """
+        (data_file, info_file) = self.paths(self.key(cities, count, kind))
+        if not os.path.exists(info_file):
+            return None
+        try:
+            with open(info_file) as info:
+                info = json.load(info)
+            data = numpy.load(data_file, mmap_mode='r')
+            n = len(cities)
+            valid = (info['cities'] == n and data.dtype == Roads.dtype and
+                     len(data) == n + 1 + info['roads'] and
+                     hashlib.sha1(data.tostring()).hexdigest() == info['sha1'])
+        except (IOError, OSError, ValueError, KeyError):
+            valid = False
+        if not valid:
+            print "Removing the invalid candidates cache entry %s" % data_file
+            self.remove(data_file, info_file)
+            return None
+        os.utime(data_file, None)
+        roads = Roads.from_arrays(data[:n + 1], data[n + 1:])
+        roads.lower_bound = info.get('lower_bound')
+        return roads
+
+    def put(self, cities, count, roads, kind='nearest'):
+        """ Save the Roads of the cities, then remove the least recently
+            used entries if the cache is too big. """
+        (data_file, info_file) = self.paths(self.key(cities, count, kind))
+        data = numpy.concatenate(roads.arrays())
+        try:
+            numpy.save(data_file, data)
+            with open(info_file, 'w') as info:
+                json.dump({'cities': len(cities), 'roads': len(roads.others), 'count': count, 'kind': kind,
+                           'lower_bound': roads.lower_bound, 'metric': cities.metric,
+                           'sha1': hashlib.sha1(data.tostring()).hexdigest()}, info)
+        except (IOError, OSError) as error:
+            print "Could not cache the candidates in %s : %s" % (data_file, error)
+            return
+        self.evict()
+
+    def remove(self, *files):
+        for name in files:
+            if os.path.exists(name):
+                os.remove(name)
+
+    def evict(self):
+        """ Remove the least recently used entries above max_bytes. """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                data_file = os.path.join(self.directory, name)
+                status = os.stat(data_file)
+                entries.append((status.st_mtime, status.st_size, data_file))
+        total = sum(size for (mtime, size, data_file) in entries)
+        for (mtime, size, data_file) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self.remove(data_file, data_file[:-len('.npy')] + '.json')
+            total -= size
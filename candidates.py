@@ -0,0 +1,12 @@
+from kdtree import KDTree
+
+
+def nearest_neighbors(points, k=None):
+    """ Return, for each of the (x, y) points, the list of the indices
+        of its k nearest other points, nearest first.
+        If k is not given, all the other points are returned. """
+    n = len(points)
+    if k is None or k > n - 1:
+        k = n - 1
+    tree = KDTree(points)
+    return [tree.nearest(x, y, k, exclude=i) for (i, (x, y)) in enumerate(points)]
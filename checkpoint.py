@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import random
+import signal
+import struct
+from array import array
+
+# Checkpoints of a long run : the best tour order, the stage and iteration
+# of the outer loop (path searches of tour_improve, or trials of IteratedLK)
+# and the random generator state, saved every 'interval' seconds to a small
+# binary file, so that an interrupted run can be resumed with tsp.py --resume.
+
+stages = ('lk', 'ils')
+
+magic = 'TSPLKCP1'
+# magic, stage, iteration, best iteration, cities count, tour length
+header = struct.Struct('<8sBqqqd')
+# random.getstate() : version, 625 words of the Mersenne twister, gauss_next
+rng_state = struct.Struct('<B625IBd')
+
+
+class Checkpoint(object):
+    """ Saves the tour given to it as an observer of tour_improve or of
+        IteratedLK.run, observer(tour, iteration, iterations, best_iteration),
+        at most every 'interval' seconds, and when save is requested.
+        The tour is always a closed tour when the observer is called, so a
+        signal only requests a save, done at the next call : SIGUSR1 saves,
+        SIGTERM saves and exits.  self.stage is set by the caller.
+
+        The file is replaced atomically : written beside it, then renamed.
+    """
+
+    def __init__(self, filename, interval=60.0, rng=random):
+        self.filename = filename
+        self.interval = interval
+        self.rng = rng
+        self.stage = 'lk'
+        self.last_save = time.time()
+        self.requested = False
+        self.exit_after_save = False
+        self.running = False
+        self.saves = 0
+        (self.iteration, self.best_iteration) = (0, 0)
+
+    def __call__(self, tour, iteration, iterations, best_iteration):
+        self.running = True
+        (self.iteration, self.best_iteration) = (iteration, best_iteration)
+        if self.requested or time.time() - self.last_save >= self.interval:
+            self.save(tour.city_sequence(), tour.tour_length(), iteration, best_iteration)
+
+    def finish(self, order, length):
+        """ Save the final tour, the cities indices along it, with the last iteration seen. """
+        self.save(order, length, self.iteration, self.best_iteration)
+
+    def chain(self, observer):
+        """ Return an observer calling observer (if not None) then this one. """
+        if observer is None:
+            return self
+
+        def both(*args):
+            observer(*args)
+            self(*args)
+        return both
+
+    def request(self, signum=None, frame=None):
+        """ Signal handler : save at the next observer call ; exit then on SIGTERM,
+            or right away if nothing is running yet. """
+        if signum == signal.SIGTERM:
+            if not self.running:
+                sys.exit(128 + signum)
+            self.exit_after_save = True
+        self.requested = True
+
+    def install(self):
+        """ Handle SIGTERM and SIGUSR1 with request. """
+        signal.signal(signal.SIGTERM, self.request)
+        signal.signal(signal.SIGUSR1, self.request)
+
+    def save(self, order, length, iteration, best_iteration):
+        order = array('i', order)
+        (version, words, gauss) = self.rng.getstate()
+        temporary = self.filename + '.tmp'
+        with open(temporary, 'wb') as output:
+            output.write(header.pack(magic, stages.index(self.stage), iteration, best_iteration, len(order), length))
+            output.write(order.tostring())
+            output.write(rng_state.pack(version, *(words + (gauss is not None, gauss or 0.0))))
+            output.flush()
+            os.fsync(output.fileno())
+        os.rename(temporary, self.filename)
+        self.last_save = time.time()
+        self.requested = False
+        self.saves += 1
+        if self.exit_after_save:
+            print "Terminated, tour of length %f saved to %s." % (length, self.filename)
+            sys.exit(128 + signal.SIGTERM)
+
+
+def load_checkpoint(filename):
+    """ Return the dict of the order, length, stage, iteration, best_iteration
+        and rng_state (for random.setstate) saved in a checkpoint file. """
+    with open(filename, 'rb') as data:
+        content = data.read()
+    if len(content) < header.size or content[:len(magic)] != magic:
+        raise ValueError("%s is not a checkpoint file." % filename)
+    (mark, stage, iteration, best_iteration, n, length) = header.unpack_from(content)
+    end = header.size + n * array('i').itemsize
+    if len(content) != end + rng_state.size:
+        raise ValueError("The checkpoint file %s is truncated." % filename)
+    order = array('i')
+    order.fromstring(content[header.size:end])
+    values = rng_state.unpack_from(content, end)
+    gauss = values[-1] if values[-2] else None
+    return {'order': order.tolist(), 'length': length, 'stage': stages[stage], 'iteration': iteration,
+            'best_iteration': best_iteration, 'rng_state': (values[0], values[1:626], gauss)}
@@ -0,0 +1,175 @@
+from array import array
+from math import hypot, sqrt, cos, acos, ceil
+import numpy
+
+
+class Cities(object):
+    """ The cities of a TSP.  A city is only its index, from 0 to N-1 :
+        the tours, paths and roads are made of these integers.
+
+          self.names[i]           = name of city i, only used for output
+          self.x[i], self.y[i]    = coordinates of city i
+
+        The coordinates are kept in two arrays of doubles (8 bytes a city),
+        read one at a time by the path search as Python floats ;
+        arrays() gives NumPy arrays sharing the same memory.
+
+        The roads lengths are the euclidean distances ; the subclasses
+        give the other distances of TSPLIB, named by their metric.
+    """
+
+    __slots__ = ('names', 'x', 'y')
+
+    metric = 'EXACT_2D'
+
+    def __init__(self, names, x, y):
+        self.names = names
+        self.x = as_doubles(x)
+        self.y = as_doubles(y)
+
+    def __len__(self):
+        return len(self.names)
+
+    def distance(self, i, j):
+        """ Length of the road between cities i and j. """
+        x = self.x
+        y = self.y
+        return hypot(x[i] - x[j], y[i] - y[j])
+
+    def distances(self, i, j):
+        """ NumPy array of the lengths of the roads between cities i and j,
+            index arrays (or an index and an array) of the same size. """
+        (x, y) = self.arrays()
+        return numpy.hypot(x[i] - x[j], y[i] - y[j])
+
+    def points(self):
+        """ Return the list of the (x, y) coordinates of the cities. """
+        return zip(self.x, self.y)
+
+    def arrays(self):
+        """ Return the NumPy arrays of the x and y coordinates (not copied). """
+        return numpy.frombuffer(self.x, dtype=float), numpy.frombuffer(self.y, dtype=float)
+
+    def append(self, name, x, y):
+        """ Add a city at (x, y) and return its index.  The names become a
+            list ; the NumPy arrays given by arrays() before don't see it. """
+        if not isinstance(self.names, list):
+            self.names = list(self.names)
+        self.names.append(name)
+        self.x.append(x)
+        self.y.append(y)
+        return len(self.names) - 1
+
+    def describe(self, i):
+        return "%s (%4.2f, %4.2f)" % (self.names[i], self.x[i], self.y[i])
+
+
+def as_doubles(values):
+    """ Return the values in an array of doubles : values itself if it is
+        one, else copied in one go if they are in an array or a NumPy array. """
+    if isinstance(values, array) and values.typecode == 'd':
+        return values
+    doubles = array('d')
+    doubles.fromstring(numpy.ascontiguousarray(values, dtype=float).tostring())
+    return doubles
+
+
+class EuclideanCities(Cities):
+    """ TSPLIB EUC_2D : euclidean distance rounded to the nearest integer. """
+
+    __slots__ = ()
+
+    metric = 'EUC_2D'
+
+    def distance(self, i, j):
+        x = self.x
+        y = self.y
+        return int(hypot(x[i] - x[j], y[i] - y[j]) + 0.5)
+
+    def distances(self, i, j):
+        return numpy.floor(super(EuclideanCities, self).distances(i, j) + 0.5)
+
+
+class CeilCities(Cities):
+    """ TSPLIB CEIL_2D : euclidean distance rounded up. """
+
+    __slots__ = ()
+
+    metric = 'CEIL_2D'
+
+    def distance(self, i, j):
+        x = self.x
+        y = self.y
+        return int(ceil(hypot(x[i] - x[j], y[i] - y[j])))
+
+    def distances(self, i, j):
+        return numpy.ceil(super(CeilCities, self).distances(i, j))
+
+
+class AttCities(Cities):
+    """ TSPLIB ATT : pseudo-euclidean distance of the att48 and att532 problems. """
+
+    __slots__ = ()
+
+    metric = 'ATT'
+
+    def distance(self, i, j):
+        x = self.x
+        y = self.y
+        r = sqrt(((x[i] - x[j]) ** 2 + (y[i] - y[j]) ** 2) / 10.0)
+        t = int(r + 0.5)
+        return t + 1 if t < r else t
+
+    def distances(self, i, j):
+        r = super(AttCities, self).distances(i, j) / sqrt(10.0)
+        t = numpy.floor(r + 0.5)
+        return numpy.where(t < r, t + 1, t)
+
+
+class GeoCities(Cities):
+    """ TSPLIB GEO : x and y are the latitude and longitude in DDD.MM format
+        (degrees and minutes) ; the distance is in kilometers on an idealized
+        sphere, rounded as in TSPLIB.  The degrees are truncated, as in
+        Concorde, which gives the known optimal tours lengths. """
+
+    __slots__ = ('latitude', 'longitude')
+
+    metric = 'GEO'
+    radius = 6378.388
+
+    def __init__(self, names, x, y):
+        super(GeoCities, self).__init__(names, x, y)
+        (x, y) = self.arrays()
+        self.latitude = as_doubles(self.radians(x))
+        self.longitude = as_doubles(self.radians(y))
+
+    @staticmethod
+    def radians(values):
+        degrees = numpy.trunc(values)
+        return 3.141592 * (degrees + 5.0 * (values - degrees) / 3.0) / 180.0
+
+    def append(self, name, x, y):
+        (latitude, longitude) = self.radians(numpy.array([x, y], dtype=float))
+        self.latitude.append(latitude)
+        self.longitude.append(longitude)
+        return super(GeoCities, self).append(name, x, y)
+
+    def distance(self, i, j):
+        (latitude, longitude) = (self.latitude, self.longitude)
+        q1 = cos(longitude[i] - longitude[j])
+        q2 = cos(latitude[i] - latitude[j])
+        q3 = cos(latitude[i] + latitude[j])
+        # Rounding errors may give slightly more than 1 for close cities.
+        return int(self.radius * acos(min(1.0, 0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3))) + 1.0)
+
+    def distances(self, i, j):
+        latitude = numpy.frombuffer(self.latitude, dtype=float)
+        longitude = numpy.frombuffer(self.longitude, dtype=float)
+        q1 = numpy.cos(longitude[i] - longitude[j])
+        q2 = numpy.cos(latitude[i] - latitude[j])
+        q3 = numpy.cos(latitude[i] + latitude[j])
+        cosine = numpy.minimum(1.0, 0.5 * ((1.0 + q1) * q2 - (1.0 - q1) * q3))
+        return numpy.floor(self.radius * numpy.arccos(cosine) + 1.0)
+
+
+metrics = dict((cls.metric, cls) for cls in (Cities, EuclideanCities, CeilCities, AttCities, GeoCities))
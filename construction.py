@@ -0,0 +1,239 @@
+import random
+from kdtree import KDTree
+from tour import Tour
+
+
+# Construction heuristics for the initial tour given to the LK search.
+# They all use the candidate roads of the Problem, or Tour.roads without
+# one (Tour.init_roads must have been called with the same Cities), falling back on a
+# KD-tree of the remaining cities when the candidates are all used up,
+# so that none of them looks at all the N*N roads.
+
+
+def candidate_roads(problem):
+    """ The candidate Roads of the Problem, or of Tour.roads without one. """
+    return Tour.roads if problem is None else problem.roads
+
+
+def candidate_pairs(cities, problem=None):
+    """ Return the (i, j) pairs of candidate roads, with i < j,
+        sorted by length (then by indices, for repeatable runs). """
+    return sorted(candidate_roads(problem).pairs(), key=lambda (i, j): (cities.distance(i, j), i, j))
+
+
+class UnionFind(object):
+    """ Disjoint sets of indices, with path halving. """
+
+    def __init__(self, n):
+        self.parent = range(n)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """ Merge the sets of i and j ; return False if already the same. """
+        (i, j) = (self.find(i), self.find(j))
+        if i == j:
+            return False
+        self.parent[i] = j
+        return True
+
+
+def join_fragments(cities, links):
+    """ Return the cities order visiting the path fragments given by
+        links[i] (the zero, one or two indices linked to city i),
+        going from the end of a fragment to the nearest end of another. """
+    n = len(cities)
+    ends = [i for i in range(n) if len(links[i]) < 2]
+    position = dict((i, k) for (k, i) in enumerate(ends))
+    tree = KDTree([(cities.x[i], cities.y[i]) for i in ends])
+    order = []
+    start = ends[0]
+    while True:
+        tree.remove(position[start])
+        (previous, city) = (None, start)
+        order.append(city)
+        while True:
+            following = [j for j in links[city] if j != previous]
+            if not following:
+                break
+            (previous, city) = (city, following[0])
+            order.append(city)
+        tree.remove(position[city])
+        if len(order) == n:
+            return order
+        start = ends[tree.nearest(cities.x[city], cities.y[city], 1)[0]]
+
+
+def random_tour(cities, tour_class=Tour, problem=None):
+    """ The cities in random order. """
+    order = range(len(cities))
+    random.shuffle(order)
+    return tour_class(order, problem)
+
+
+def nearest_neighbor_tour(cities, tour_class=Tour, problem=None):
+    """ From the first city, always go to the nearest city not visited :
+        the first one left in the candidates, else the nearest one found
+        in a KD-tree of the cities not visited yet. """
+    n = len(cities)
+    roads = candidate_roads(problem)
+    tree = KDTree(cities.points())
+    visited = [False] * n
+    city = 0
+    order = [city]
+    visited[city] = True
+    tree.remove(city)
+    while len(order) < n:
+        following = None
+        for j in roads.get_by_length(city):
+            if not visited[j]:
+                following = j
+                break
+        if following is None:
+            following = tree.nearest(cities.x[city], cities.y[city], 1)[0]
+        city = following
+        order.append(city)
+        visited[city] = True
+        tree.remove(city)
+    return tour_class(order, problem)
+
+
+def greedy_tour(cities, tour_class=Tour, problem=None):
+    """ Greedy matching : take the candidate roads from the shortest,
+        keeping those which don't give a city three roads nor close a cycle.
+        The path fragments left are then joined from nearest ends. """
+    n = len(cities)
+    links = [[] for i in range(n)]
+    sets = UnionFind(n)
+    for (i, j) in candidate_pairs(cities, problem):
+        if len(links[i]) < 2 and len(links[j]) < 2 and sets.union(i, j):
+            links[i].append(j)
+            links[j].append(i)
+    return tour_class(join_fragments(cities, links), problem)
+
+
+def hilbert_index(size, x, y):
+    """ Return the distance of (x, y) along the Hilbert curve
+        filling the size * size grid, size being a power of 2. """
+    d = 0
+    s = size / 2
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                (x, y) = (size - 1 - x, size - 1 - y)
+            (x, y) = (y, x)
+        s /= 2
+    return d
+
+
+def space_filling_curve_tour(cities, tour_class=Tour, problem=None):
+    """ The cities in the order of a Hilbert curve over their bounding box. """
+    size = 1 << 16
+    (x, y) = (cities.x, cities.y)
+    (xmin, ymin) = (min(x), min(y))
+    span = max(max(x) - xmin, max(y) - ymin) or 1
+    scale = (size - 1) / float(span)
+    key = lambda i: hilbert_index(size, int((x[i] - xmin) * scale), int((y[i] - ymin) * scale))
+    return tour_class(sorted(range(len(cities)), key=key), problem)
+
+
+def euler_walk(start, edges, incident, used, position):
+    """ Return the vertices of the Euler circuit from start (Hierholzer),
+        over the edges not used yet ; position[v] is the next of
+        incident[v] to look at. """
+    stack = [start]
+    walk = []
+    while stack:
+        v = stack[-1]
+        while position[v] < len(incident[v]) and used[incident[v][position[v]]]:
+            position[v] += 1
+        if position[v] < len(incident[v]):
+            e = incident[v][position[v]]
+            used[e] = True
+            (a, b) = edges[e]
+            stack.append(b if a == v else a)
+        else:
+            walk.append(stack.pop())
+    return walk
+
+
+def christofides_lite_tour(cities, tour_class=Tour, problem=None):
+    """ Christofides-like : minimum spanning tree of the candidate roads,
+        its odd degree cities matched greedily (candidate roads first, then
+        nearest odd city left), and the Euler circuit of the tree and matching
+        shortcut to visit each city once.  The candidate graph may not be
+        connected ; the walks of its parts are then joined from nearest ends. """
+    n = len(cities)
+    pairs = candidate_pairs(cities, problem)
+    edges = []
+    sets = UnionFind(n)
+    for (i, j) in pairs:
+        if sets.union(i, j):
+            edges.append((i, j))
+    degree = [0] * n
+    for (i, j) in edges:
+        degree[i] += 1
+        degree[j] += 1
+    odd = [i for i in range(n) if degree[i] % 2]
+    unmatched = set(odd)
+    for (i, j) in pairs:
+        if i in unmatched and j in unmatched:
+            edges.append((i, j))
+            unmatched.remove(i)
+            unmatched.remove(j)
+    if unmatched:
+        left = [i for i in odd if i in unmatched]
+        position = dict((i, k) for (k, i) in enumerate(left))
+        tree = KDTree([(cities.x[i], cities.y[i]) for i in left])
+        for i in left:
+            if i not in unmatched:
+                continue
+            tree.remove(position[i])
+            j = left[tree.nearest(cities.x[i], cities.y[i], 1)[0]]
+            tree.remove(position[j])
+            edges.append((i, j))
+            unmatched.remove(i)
+            unmatched.remove(j)
+    incident = [[] for i in range(n)]
+    for (e, (i, j)) in enumerate(edges):
+        incident[i].append(e)
+        incident[j].append(e)
+    used = [False] * len(edges)
+    position = [0] * n
+    seen = [False] * n
+    links = [[] for i in range(n)]
+    for start in range(n):
+        if seen[start]:
+            continue
+        previous = None
+        for v in euler_walk(start, edges, incident, used, position):
+            if not seen[v]:
+                seen[v] = True
+                if previous is not None:
+                    links[previous].append(v)
+                    links[v].append(previous)
+                previous = v
+    return tour_class(join_fragments(cities, links), problem)
+
+
+tour_builders = {
+    'random': random_tour,
+    'nearest-neighbor': nearest_neighbor_tour,
+    'greedy': greedy_tour,
+    'space-filling-curve': space_filling_curve_tour,
+    'christofides-lite': christofides_lite_tour,
+}
+
+
+def build_tour(name, cities, tour_class=Tour, problem=None):
+    """ Return the initial tour of the Cities built by the named heuristic,
+        with the candidate roads of the Problem if given. """
+    return tour_builders[name](cities, tour_class, problem)
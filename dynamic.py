@@ -0,0 +1,128 @@
+from kdtree import KDTree
+from problem import Problem
+from roads import DynamicRoads
+from tour import Tour
+from lk import tour_improve
+from solver import make_cities, tour_classes
+
+# Re-optimization of a solved tour when a few cities are added or removed :
+# the candidates only change around these cities, a new city is put on
+# the cheapest road next to one of its candidates, a removed one is cut out
+# of the tour, and the LK search starts only from the cities of the changed
+# roads.  The work done is about proportional to the number of cities
+# changed, not to the number of cities of the tour.
+
+
+class Reoptimizer(object):
+    """ Keeps a solved tour (of a Problem, or of the Tour class attributes)
+        good while cities are added and removed with update().
+        The cities keep their indices : a removed city stays in the Cities,
+        out of the tour and of the candidates of the other cities, and the
+        new cities are appended to the Cities.
+
+        The candidates of the new cities are their 'candidates' nearest
+        cities, found with a KD-tree of the cities in the tour.
+    """
+
+    def __init__(self, tour, neighbors=3, candidates=10, depth=None, search=None):
+        assert tour.is_tour()
+        self.tour = tour
+        self.neighbors = neighbors
+        self.candidates = candidates
+        self.depth = depth
+        self.search = search
+        self.cities = tour.all_cities
+        self.roads = DynamicRoads.from_roads(tour.roads)
+        if tour.problem is None:
+            # The tours made from this one (by IteratedLK) get the same roads.
+            tour.problem = Problem(self.cities, self.roads, tour.stats, tour.transpositions)
+        tour.problem.roads = tour.roads = self.roads
+        self.tree = KDTree(self.cities.points())
+        in_tour = set(tour.city_sequence())
+        for city in range(len(self.cities)):
+            if city not in in_tour:
+                self.tree.remove(city)
+
+    @classmethod
+    def from_order(cls, coords, order, names=None, metric='EXACT_2D', neighbors=3, candidates=10,
+                   backend='array', depth=None, search=None):
+        """ Return the Reoptimizer of the tour going through the cities at
+            coords (as given to solve()) in order, e.g. the order solve() returned. """
+        cities = make_cities(coords, names, metric)
+        roads = Tour.candidate_roads(cities, max(candidates, neighbors))
+        tour = tour_classes[backend](order, Problem(cities, roads))
+        return cls(tour, neighbors, candidates, depth, search)
+
+    def in_tour(self, city):
+        return city < len(self.tree.removed) and not self.tree.removed[city]
+
+    def update(self, added=(), removed=()):
+        """ Remove the cities indices removed from the tour, add the cities
+            added, each one (x, y) or (name, x, y), then improve the tour
+            around them.  Return the indices of the added cities. """
+        self.roads.lower_bound = None
+        touched = []
+        for city in removed:
+            if not self.in_tour(city):
+                raise ValueError("City %i is not in the tour." % city)
+            touched.extend(self.tour.remove_city(city))
+            self.tree.remove(city)
+            self.unlink(city)
+        new_cities = []
+        for point in added:
+            (name, x, y) = point if len(point) == 3 else (None, point[0], point[1])
+            city = self.cities.append(str(len(self.cities)) if name is None else name, x, y)
+            self.tree.points.append((x, y))
+            self.tree.insert(city)
+            for other in self.tree.nearest(x, y, self.candidates, exclude=city):
+                self.link(city, other)
+            (a, b) = self.cheapest_road(city)
+            self.tour.insert_city(city, a, b)
+            touched.extend((a, city, b))
+            new_cities.append(city)
+        start_cities = []
+        for city in touched:
+            if self.in_tour(city) and city not in start_cities:
+                start_cities.append(city)
+        tour_improve(self.tour, self.neighbors, False, self.depth, start_cities=start_cities, quiet=True,
+                     search=self.search)
+        return new_cities
+
+    def link(self, i, j):
+        """ Make the road (i, j) a candidate of both cities, before the
+            first longer candidate (the others keep their order). """
+        distance = self.cities.distance
+        for (a, b) in ((i, j), (j, i)):
+            others = list(self.roads.get_by_length(a))
+            if b in others:
+                continue
+            key = (distance(a, b), b)
+            k = 0
+            while k < len(others) and (distance(a, others[k]), others[k]) <= key:
+                k += 1
+            others.insert(k, b)
+            self.roads.set_candidates(a, others)
+
+    def unlink(self, city):
+        """ Remove the candidate roads of a city out of the tour ; the cities
+            left with less than self.candidates get their nearest ones back. """
+        for other in self.roads.get_by_length(city):
+            others = [k for k in self.roads.get_by_length(other) if k != city]
+            self.roads.set_candidates(other, others)
+            if len(others) < self.candidates:
+                (x, y) = self.tree.points[other]
+                for k in self.tree.nearest(x, y, self.candidates, exclude=other):
+                    self.link(other, k)
+        self.roads.set_candidates(city, [])
+
+    def cheapest_road(self, city):
+        """ Return the road (a, b) of the tour next to a candidate of city
+            whose replacement by (a, city) and (city, b) is the shortest. """
+        (tour, distance) = (self.tour, self.cities.distance)
+        best = None
+        for c in self.roads.get_by_length(city):
+            for (a, b) in ((c, tour.next_city(c)), (tour.prev_city(c), c)):
+                cost = distance(a, city) + distance(city, b) - distance(a, b)
+                if best is None or cost < best[0]:
+                    best = (cost, a, b)
+        return best[1:]
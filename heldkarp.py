@@ -0,0 +1,337 @@
+import numpy
+from kdtree import KDTree
+from roads import Roads
+from candidates import nearest_neighbors
+
+# Subgradient iterations of the Held-Karp ascent, each one a minimum 1-tree.
+ascent_iterations = 100
+
+# Iterations without a better bound before the step is halved.
+ascent_patience = 5
+
+# Nearest neighbors of each city in the sparse graph the 1-trees are built on.
+graph_neighbors = 15
+
+# Ascents at most, each one followed by the bound on the complete graph.
+ascent_rounds = 3
+
+# Above this count of cities, the lower bound is not computed : it needs
+# a minimum 1-tree of the complete graph, O(N*N).
+exact_bound_limit = 20000
+
+
+def spanning_forest(n, u, v, weights):
+    """ Boruvka's algorithm, vectorized with NumPy : return the indices of
+        the edges (u[e], v[e]) of a minimum spanning forest of the n nodes,
+        and the component (a node index) of each node.  Equal weights are
+        ordered by index, so that the lightest edges of the components
+        never make a cycle. """
+    order = numpy.argsort(weights, kind='mergesort')
+    (u, v) = (u[order], v[order])
+    component = numpy.arange(n)
+    edges = numpy.arange(len(u))
+    chosen = []
+    while True:
+        (cu, cv) = (component[u[edges]], component[v[edges]])
+        outgoing = cu != cv
+        (edges, cu, cv) = (edges[outgoing], cu[outgoing], cv[outgoing])
+        if not len(edges):
+            break
+        # The lightest outgoing edge of each component : its first one
+        # once sorted by component, then by rank.
+        keys = numpy.concatenate((cu, cv)) * len(u) + numpy.concatenate((edges, edges))
+        keys.sort()
+        (ends, ranks) = (keys // len(u), keys % len(u))
+        lightest = numpy.ones(len(ends), dtype=bool)
+        lightest[1:] = ends[1:] != ends[:-1]
+        (ends, ranks) = (ends[lightest], ranks[lightest])
+        # Each component is hooked to the component at the other end ;
+        # two components hooked to each other chose the same edge,
+        # the smaller one becomes the root of the merged component.
+        (a, b) = (component[u[ranks]], component[v[ranks]])
+        parent = numpy.arange(n)
+        parent[ends] = numpy.where(a == ends, b, a)
+        mutual = ends[(parent[parent[ends]] == ends) & (ends < parent[ends])]
+        parent[mutual] = mutual
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                break
+            parent = grandparent
+        component = parent[component]
+        chosen.append(numpy.unique(ranks))
+    chosen = numpy.concatenate(chosen) if chosen else numpy.zeros(0, dtype=int)
+    return order[chosen], component
+
+
+def preorder(n, u, v, root):
+    """ Walk the tree of edges (u[e], v[e]) from root : return the nodes
+        in preorder, the parent of each node and the edge to its parent. """
+    ends = numpy.concatenate((u, v))
+    others = numpy.concatenate((v, u))
+    edges = numpy.concatenate((numpy.arange(len(u)), numpy.arange(len(u))))
+    by_node = numpy.argsort(ends, kind='mergesort')
+    (others, edges) = (others[by_node].tolist(), edges[by_node].tolist())
+    start = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(ends, minlength=n)))).tolist()
+    parent = [-1] * n
+    parent_edge = [-1] * n
+    parent[root] = root
+    order = []
+    stack = [root]
+    while stack:
+        i = stack.pop()
+        order.append(i)
+        for k in range(start[i], start[i + 1]):
+            j = others[k]
+            if parent[j] < 0:
+                parent[j] = i
+                parent_edge[j] = edges[k]
+                stack.append(j)
+    return order, parent, parent_edge
+
+
+class HeldKarp(object):
+    """ Minimum 1-trees of the cities with node penalties pi, as in LKH :
+        the length of a road (i, j) becomes d(i, j) + pi[i] + pi[j], which
+        doesn't change which tour is the shortest, and a 1-tree is
+        a spanning tree of the cities 1 to N-1, plus the two shortest
+        roads of city 0.  Every tour is a 1-tree, so
+
+          w(pi) = length of the minimum 1-tree - 2 * sum(pi)
+
+        is a lower bound of the tour lengths ; the subgradient ascent
+        looks for the penalties of the best bound, where the 1-tree
+        is closest to a tour (all its degrees are 2).
+
+        The 1-trees of the ascent are built on a sparse graph, the roads
+        to the graph_neighbors nearest neighbors of each city ; the bound
+        is then computed on the complete graph.  With the penalties, its
+        1-tree may use roads missing from the sparse graph (between
+        clusters of cities), which are then added to it for another ascent.
+
+        The alpha-nearness of a road of the sparse graph is how much longer
+        the minimum 1-tree containing it is : its penalized length minus
+        the longest road on the 1-tree path between its cities.
+    """
+
+    def __init__(self, cities, neighbors=graph_neighbors):
+        self.cities = cities
+        n = self.n = len(cities)
+        if n < 3:
+            raise ValueError("The 1-trees need 3 cities or more, there are %i." % n)
+        rows = nearest_neighbors(cities.points(), neighbors)
+        (u, v) = self.sparse_graph(rows)
+        self.u0 = v[u == 0]
+        (u, v) = (u[u != 0], v[u != 0])
+        # The sparse graph may have several components (clusters of
+        # cities) : they are linked, nearest representative first.
+        component = spanning_forest(n, u, v, cities.distances(u, v))[1]
+        roots = numpy.unique(component[1:])
+        if len(roots) > 1:
+            (u, v) = self.link_components(u, v, roots)
+        (self.u, self.v) = (u, v)
+        self.cost = cities.distances(u, v)
+        self.cost0 = cities.distances(0, self.u0)
+        self.pi = numpy.zeros(n)
+        self.bound = None
+
+    def sparse_graph(self, rows):
+        """ Return the roads (u, v), u < v, of the neighbors lists. """
+        n = self.n
+        u = numpy.repeat(numpy.arange(n), [len(row) for row in rows])
+        v = numpy.concatenate([numpy.asarray(row, dtype=int) for row in rows])
+        keys = numpy.unique(numpy.minimum(u, v) * n + numpy.maximum(u, v))
+        return keys // n, keys % n
+
+    def link_components(self, u, v, roots):
+        (x, y) = self.cities.arrays()
+        points = zip(x[roots], y[roots])
+        tree = KDTree(points)
+        (a, b) = ([], [])
+        k = 0
+        tree.remove(k)
+        for step in range(len(roots) - 1):
+            j = tree.nearest(points[k][0], points[k][1], 1)[0]
+            tree.remove(j)
+            a.append(min(roots[k], roots[j]))
+            b.append(max(roots[k], roots[j]))
+            k = j
+        return numpy.concatenate((u, a)), numpy.concatenate((v, b))
+
+    def one_tree(self, pi):
+        """ Return w(pi), the degrees of the minimum 1-tree, its roads
+            (indices in self.u and self.v) and the two roads of city 0
+            (indices in self.u0). """
+        (u, v) = (self.u, self.v)
+        weights = self.cost + pi[u] + pi[v]
+        tree = spanning_forest(self.n, u, v, weights)[0]
+        weights0 = self.cost0 + pi[self.u0]
+        roads0 = numpy.lexsort((numpy.arange(len(weights0)), weights0))[:2]
+        degrees = numpy.bincount(u[tree], minlength=self.n) + numpy.bincount(v[tree], minlength=self.n)
+        degrees[0] = 2
+        degrees[self.u0[roads0]] += 1
+        length = weights[tree].sum() + weights0[roads0].sum() + 2 * pi[0]
+        return length - 2 * pi.sum(), degrees, tree, roads0
+
+    def tour_length(self, tree):
+        """ Length of the tour visiting the cities along the tree walk :
+            an upper bound of the shortest tour, for the ascent step. """
+        order = preorder(self.n, self.u[tree], self.v[tree], 1)[0]
+        order = numpy.array([0] + order)
+        return self.cities.distances(order, numpy.roll(order, 1)).sum()
+
+    def ascent(self, iterations=ascent_iterations):
+        """ Subgradient optimization of the penalties (Held and Karp, with
+            the step of Held, Wolfe and Crowder and the directions of LKH) ;
+            start from self.pi and keep there the penalties of the best
+            bound, return it. """
+        pi = self.pi
+        (length, degrees, tree, roads0) = self.one_tree(pi)
+        upper = self.tour_length(tree)
+        (best, best_pi) = (length, pi)
+        scale = 2.0
+        idle = 0
+        last = numpy.zeros(self.n)
+        for iteration in range(iterations):
+            gradient = degrees - 2
+            norm = numpy.dot(gradient, gradient)
+            if norm == 0 or length >= upper:
+                # The 1-tree is a tour, the shortest one.
+                break
+            direction = 0.7 * gradient + 0.3 * last
+            last = gradient
+            pi = pi + scale * (upper - length) / norm * direction
+            (length, degrees, tree, roads0) = self.one_tree(pi)
+            if length > best:
+                (best, best_pi) = (length, pi)
+                idle = 0
+            else:
+                idle += 1
+                if idle == ascent_patience:
+                    scale /= 2
+                    idle = 0
+        self.pi = best_pi
+        return best
+
+    def lower_bound(self):
+        """ w(pi) on the complete graph, with the minimum spanning tree
+            of Prim's algorithm : a lower bound of the tour lengths.
+            The roads of this tree missing from the sparse graph are
+            added to it ; return their count. """
+        (cities, pi) = (self.cities, self.pi)
+        remaining = numpy.arange(2, self.n)
+        keys = cities.distances(1, remaining) + pi[remaining] + pi[1]
+        nearest = numpy.ones(len(remaining), dtype=int)
+        length = 0.0
+        (u, v) = ([], [])
+        while len(remaining):
+            k = numpy.argmin(keys)
+            (i, length) = (remaining[k], length + keys[k])
+            u.append(min(i, nearest[k]))
+            v.append(max(i, nearest[k]))
+            (remaining[k], keys[k], nearest[k]) = (remaining[-1], keys[-1], nearest[-1])
+            (remaining, keys, nearest) = (remaining[:-1], keys[:-1], nearest[:-1])
+            lengths = cities.distances(i, remaining) + pi[remaining] + pi[i]
+            closer = lengths < keys
+            keys[closer] = lengths[closer]
+            nearest[closer] = i
+        others = numpy.arange(1, self.n)
+        length += numpy.sort(cities.distances(0, others) + pi[others])[:2].sum() + 2 * pi[0]
+        self.bound = length - 2 * pi.sum()
+        n = self.n
+        known = numpy.in1d(numpy.array(u) * n + numpy.array(v), self.u * n + self.v)
+        (u, v) = (numpy.array(u)[~known], numpy.array(v)[~known])
+        if len(u):
+            (self.u, self.v) = (numpy.concatenate((self.u, u)), numpy.concatenate((self.v, v)))
+            self.cost = numpy.concatenate((self.cost, cities.distances(u, v)))
+        return len(u)
+
+    def alphas(self):
+        """ Return the alpha-nearness of the roads (u, v) and (0, u0) with
+            the current penalties, and their penalized lengths. """
+        (u, v, pi) = (self.u, self.v, self.pi)
+        weights = self.cost + pi[u] + pi[v]
+        (length, degrees, tree, roads0) = self.one_tree(pi)
+        (order, parent, parent_edge) = preorder(self.n, u[tree], v[tree], 1)
+        # up[k][i] is the ancestor of i 2**k levels higher, longest[k][i]
+        # the longest road on the way, for the longest road on the path
+        # between the two cities of each road in O(log N) vector steps.
+        parent = numpy.array(parent)
+        parent[0] = 0
+        up_weight = numpy.full(self.n, -numpy.inf)
+        has_parent = numpy.array(parent_edge) >= 0
+        up_weight[has_parent] = weights[tree][numpy.array(parent_edge)[has_parent]]
+        depth = numpy.zeros(self.n, dtype=int)
+        for i in order[1:]:
+            depth[i] = depth[parent[i]] + 1
+        up = [parent]
+        longest = [up_weight]
+        while (1 << len(up)) <= depth.max():
+            (above, weight) = (up[-1], longest[-1])
+            up.append(above[above])
+            longest.append(numpy.maximum(weight, weight[above]))
+        (a, b) = (u.copy(), v.copy())
+        swap = depth[a] < depth[b]
+        (a[swap], b[swap]) = (b[swap], a[swap])
+        path = numpy.full(len(a), -numpy.inf)
+        climb = depth[a] - depth[b]
+        for k in range(len(up)):
+            step = (climb >> k) & 1 == 1
+            path[step] = numpy.maximum(path[step], longest[k][a[step]])
+            a[step] = up[k][a[step]]
+        for k in reversed(range(len(up))):
+            step = up[k][a] != up[k][b]
+            path[step] = numpy.maximum(path[step], numpy.maximum(longest[k][a[step]], longest[k][b[step]]))
+            (a[step], b[step]) = (up[k][a[step]], up[k][b[step]])
+        step = a != b
+        path[step] = numpy.maximum(path[step], numpy.maximum(longest[0][a[step]], longest[0][b[step]]))
+        weights0 = self.cost0 + pi[self.u0] + pi[0]
+        alpha0 = numpy.maximum(0, weights0 - weights0[roads0].max())
+        return (numpy.concatenate((numpy.maximum(0, weights - path), alpha0)),
+                numpy.concatenate((weights, weights0)))
+
+    def roads(self, count):
+        """ Return the Roads of the count alpha-nearest candidates of each
+            city, smallest alpha first (then shortest) ; as for the nearest
+            candidates, a road chosen by one of its cities is a candidate
+            of both. """
+        (alpha, weights) = self.alphas()
+        u = numpy.concatenate((self.u, numpy.zeros(len(self.u0), dtype=int)))
+        v = numpy.concatenate((self.v, self.u0))
+        (city, other, alpha, weights) = (numpy.concatenate((u, v)), numpy.concatenate((v, u)),
+                                         numpy.concatenate((alpha, alpha)), numpy.concatenate((weights, weights)))
+        order = numpy.lexsort((other, weights, alpha, city))
+        start = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(city, minlength=self.n))))
+        rank = numpy.arange(len(order)) - start[city[order]]
+        chosen = numpy.zeros(len(city), dtype=bool)
+        chosen[order[rank < count]] = True
+        # The road of each chosen (city, other) is kept in both directions.
+        half = len(u)
+        chosen[:half] |= chosen[half:]
+        chosen[half:] = chosen[:half]
+        order = order[chosen[order]]
+        start = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(city[chosen], minlength=self.n))))
+        roads = Roads.from_arrays(start, other[order])
+        roads.lower_bound = self.bound
+        return roads
+
+
+def alpha_roads(cities, count, iterations=ascent_iterations):
+    """ Return the Roads of the count alpha-nearest candidates of each city,
+        after the Held-Karp ascent ; their lower_bound is set, except
+        above exact_bound_limit cities.  Below 3 cities, they are the
+        nearest candidates, as there is no 1-tree. """
+    if len(cities) < 3:
+        # No 1-tree below 3 cities : the candidates are the nearest ones,
+        # and the bound is the length of the only tour.
+        roads = Roads(cities, nearest_neighbors(cities.points(), count))
+        roads.lower_bound = 2 * cities.distance(0, 1) if len(cities) == 2 else 0.0
+        return roads
+    held_karp = HeldKarp(cities, max(graph_neighbors, count))
+    held_karp.ascent(iterations)
+    if len(cities) <= exact_bound_limit:
+        rounds = 1
+        while held_karp.lower_bound() and rounds < ascent_rounds:
+            held_karp.ascent(iterations)
+            rounds += 1
+    return held_karp.roads(count)
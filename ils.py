@@ -0,0 +1,106 @@
+import random
+import time
+from lk import tour_improve, shorter
+
+
+def double_bridge(tour, cities, rng=random, segment=None):
+    """ Cut the closed tour in four parts A B C D and make it A C B D in
+        place, with three reversals : B C to C' B', then C' and B'.
+        Return these reversals (a, b), each one undone by reverse_path(b, a),
+        and the six cities at the ends of the changed roads.
+        This 4-opt move can't be undone by a sequence of LK flips.
+        cities are the cities of the tour, in any order.
+        If segment is given, B and C are at most that many cities long,
+        so the kick stays local on large tours and only walks along them. """
+    n = len(cities)
+    if segment is None or 3 * segment >= n:
+        order = tour.city_sequence()
+        (p1, p2, p3) = sorted(rng.sample(range(1, n), 3))
+        (a, b1, b2, c1, c2, d) = (order[p1 - 1], order[p1], order[p2 - 1], order[p2], order[p3 - 1], order[p3 % n])
+    else:
+        a = rng.choice(cities)
+        b1 = b2 = tour.next_city(a)
+        for step in range(rng.randint(1, segment) - 1):
+            b2 = tour.next_city(b2)
+        c1 = c2 = tour.next_city(b2)
+        for step in range(rng.randint(1, segment) - 1):
+            c2 = tour.next_city(c2)
+        d = tour.next_city(c2)
+    reversals = [(b1, c2), (c2, c1), (b2, b1)]
+    for (x, y) in reversals:
+        tour.reverse_path(x, y)
+    return reversals, [a, b2, c2, b1, c1, d]
+
+
+class IteratedLK(object):
+    """ Iterated Lin-Kernighan : kick the best tour with a double bridge,
+        repair it with LK path searches started only from the cities
+        around the kick, and keep it if it is shorter.
+        This is an anytime search : self.best is the best tour so far,
+        whenever it is read. """
+
+    def __init__(self, tour, lk_max_search_roads, lk_depth_limit=None, rng=random, segment=50, search=None):
+        self.best = tour
+        # The best tour order, to get it back if a trial is interrupted.
+        self.order = tour.city_sequence()
+        self.length = tour.tour_length()
+        self.search = search
+        self.lk_max_search_roads = lk_max_search_roads
+        self.lk_depth_limit = lk_depth_limit
+        self.rng = rng
+        self.segment = segment
+        self.trials = 0
+        self.best_trial = 0
+
+    def trial(self):
+        """ Do one kick and local LK ; return True if the best tour improved.
+            The kick and the LK changes are done on the best tour itself,
+            and undone (with its journal) if it is not shorter, so a trial
+            only costs the cities around the kick. """
+        self.trials += 1
+        tour = self.best
+        if len(tour) < 8:
+            return False
+        length = tour.tour_length()
+        (reversals, ends) = double_bridge(tour, self.order, self.rng, self.segment)
+        tour.journal = []
+        tour_improve(tour, self.lk_max_search_roads, False, self.lk_depth_limit, start_cities=ends, quiet=True,
+                     search=self.search)
+        (journal, tour.journal) = (tour.journal, None)
+        if shorter(tour.tour_length(), length):
+            (self.best_trial, self.length) = (self.trials, tour.tour_length())
+            self.order = tour.city_sequence()
+            return True
+        for entry in reversed(journal):
+            tour.undo_close(*entry)
+        for (a, b) in reversed(reversals):
+            tour.reverse_path(b, a)
+        # Without the rounding errors of the changes undone.
+        tour.length = length
+        return False
+
+    def run(self, time_limit=None, max_trials=None, observer=None, quiet=False):
+        """ Do trials until time_limit seconds or max_trials trials are spent.
+            If given, observer(best_tour, trial, max_trials, best_trial)
+            is called after each trial. Return the best tour.
+            The improvements are not printed if quiet is set. """
+        end = None if time_limit is None else time.time() + time_limit
+        first = self.trials
+        while not (max_trials is not None and self.trials - first >= max_trials) and \
+                not (end is not None and time.time() >= end):
+            try:
+                improved = self.trial()
+            except KeyboardInterrupt:
+                # The best tour may be left kicked or half repaired.
+                self.best = self.best.new(self.order)
+                raise
+            if improved and not quiet:
+                print "---- trial %i improved the tour to %f" % (self.trials, self.best.tour_length())
+            if observer:
+                observer(self.best, self.trials - first, max_trials or 0, self.best_trial)
+        return self.best
+
+    def report(self):
+        # The best tour itself may be kicked when this is called from a signal handler.
+        return "===== %i trials ; best tour found on trial %i has length %f" % \
+            (self.trials, self.best_trial, self.length)
@@ -0,0 +1,145 @@
+import heapq
+
+
+class KDTree(object):
+    """ A 2-d tree over a list of (x, y) points, to find the nearest
+        neighbors of a point without looking at all the other points.
+        The nodes are stored in flat lists, indexed by node number :
+
+          self.bucket[node]   = point indices of a leaf, None for a split node
+          self.axis[node]     = 0 if the node splits on x, 1 on y
+          self.split[node]    = coordinate of the splitting line
+          self.low[node]      = child node on the lower side of the line
+          self.high[node]     = child node on the higher side
+          self.parent[node]   = parent node, None for the root
+          self.count[node]    = number of points left under the node
+
+        Points can be removed, so that the tree finds the nearest
+        points not visited yet ; empty nodes are not searched.
+        Points appended to the points list can be inserted : a leaf
+        holding too many points is split again.
+    """
+
+    leaf_size = 8
+
+    def __init__(self, points):
+        self.points = points
+        self.bucket = []
+        self.axis = []
+        self.split = []
+        self.low = []
+        self.high = []
+        self.parent = []
+        self.count = []
+        self.leaf_of = [None] * len(points)
+        self.removed = [False] * len(points)
+        self.root = self._build(range(len(points)))
+
+    def _new_node(self, parent=None):
+        for nodes in (self.bucket, self.axis, self.split, self.low, self.high, self.count):
+            nodes.append(None)
+        self.parent.append(parent)
+        return len(self.bucket) - 1
+
+    def _build(self, indices, root=None):
+        """ Build the tree (or the subtree of the leaf root) with an explicit
+            stack, splitting each set of points on its median along its widest axis. """
+        if root is None:
+            root = self._new_node()
+        stack = [(root, indices)]
+        while stack:
+            (node, indices) = stack.pop()
+            self.count[node] = len(indices)
+            if len(indices) <= self.leaf_size:
+                self.bucket[node] = indices
+                for i in indices:
+                    self.leaf_of[i] = node
+                continue
+            xs = [self.points[i][0] for i in indices]
+            ys = [self.points[i][1] for i in indices]
+            axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+            indices.sort(key=lambda i: self.points[i][axis])
+            middle = len(indices) // 2
+            self.axis[node] = axis
+            self.split[node] = self.points[indices[middle]][axis]
+            self.low[node] = self._new_node(node)
+            self.high[node] = self._new_node(node)
+            stack.append((self.low[node], indices[:middle]))
+            stack.append((self.high[node], indices[middle:]))
+        return root
+
+    def insert(self, i):
+        """ Insert point i, appended to the points since the tree was built
+            or removed from the tree. """
+        if i >= len(self.removed):
+            self.leaf_of.extend([None] * (i + 1 - len(self.removed)))
+            self.removed.extend([True] * (i + 1 - len(self.removed)))
+        elif not self.removed[i]:
+            return
+        self.removed[i] = False
+        node = self.leaf_of[i]
+        if node is not None and self.bucket[node] is not None and i in self.bucket[node]:
+            # Removed but still held by its leaf : count it again.
+            while node is not None:
+                self.count[node] += 1
+                node = self.parent[node]
+            return
+        point = self.points[i]
+        node = self.root
+        while self.bucket[node] is None:
+            self.count[node] += 1
+            node = self.low[node] if point[self.axis[node]] < self.split[node] else self.high[node]
+        self.count[node] += 1
+        bucket = self.bucket[node]
+        bucket.append(i)
+        self.leaf_of[i] = node
+        if len(bucket) > 4 * self.leaf_size:
+            self.bucket[node] = None
+            self._build([j for j in bucket if not self.removed[j]], node)
+
+    def remove(self, i):
+        """ Remove point i from the tree. """
+        if self.removed[i]:
+            return
+        self.removed[i] = True
+        node = self.leaf_of[i]
+        while node is not None:
+            self.count[node] -= 1
+            node = self.parent[node]
+
+    def nearest(self, x, y, k, exclude=None):
+        """ Return the indices of the k points closest to (x, y),
+            nearest first, skipping the point index exclude. """
+        if k <= 0:
+            return []
+        (points, buckets, axes, splits, lows, highs, counts, removed) = \
+            (self.points, self.bucket, self.axis, self.split, self.low, self.high, self.count, self.removed)
+        heap = []  # (-squared distance, index) ; the farthest point on top.
+        stack = [(self.root, 0)]  # (node, squared distance to its region)
+        while stack:
+            (node, bound) = stack.pop()
+            if counts[node] == 0 or (len(heap) == k and bound >= -heap[0][0]):
+                continue
+            bucket = buckets[node]
+            if bucket is not None:
+                for i in bucket:
+                    if i == exclude or removed[i]:
+                        continue
+                    (px, py) = points[i]
+                    (dx, dy) = (px - x, py - y)
+                    d = dx * dx + dy * dy
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, i))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, i))
+                continue
+            diff = (x if axes[node] == 0 else y) - splits[node]
+            if diff < 0:
+                (near, far) = (lows[node], highs[node])
+            else:
+                (near, far) = (highs[node], lows[node])
+            # The near side is popped first ; the far side only gets searched
+            # if the splitting line is closer than the k-th best found by then.
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return [i for (distance, i) in sorted(heap, reverse=True)]
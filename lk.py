@@ -0,0 +1,334 @@
+import time
+from collections import deque
+from road import other
+
+# Tours shorter by less than this fraction of their length are rounding
+# errors of the lengths sums.
+epsilon = 1e-9
+
+
+def shorter(length, old_length):
+    """ Return True if length is shorter than old_length by more than
+        the rounding errors of the lengths sums. """
+    return length < old_length - epsilon * max(1.0, abs(old_length))
+
+
+def city_starts(tour, city):
+    """ Return the two (road, backward) starts for tour2path
+        giving a path which ends with city : the road removed
+        goes from city to its next or to its previous city. """
+    return [(tour.get_road(city, tour.next_city(city)), False),
+            (tour.get_road(tour.prev_city(city), city), True)]
+
+
+def path_start(tour, city, first):
+    """ Return the (road, backward) start for tour2path giving a path
+        from first to city, or None if they are not neighbors in the tour. """
+    if tour.next_city(city) == first:
+        return tour.get_road(city, first), False
+    if tour.prev_city(city) == first:
+        return tour.get_road(first, city), True
+    return None
+
+
+def queue_cities(queue, queued, cities):
+    """ Append to the queue the cities which are not queued yet. """
+    for city in cities:
+        if city not in queued:
+            queued.add(city)
+            queue.append(city)
+
+
+def apply_mods(tour, mods, check=False):
+    """ Do the (city, road_add, road_rm) modifications found by path_search
+        on the path and close it.  Return the cities at the ends of the roads
+        removed and added, which are the ones to search from again.
+        With check set, the modifications may have been found on another
+        version of the tour : if one of them is not valid on this path or
+        they don't make the tour shorter, they are undone, the path is
+        converted back to the tour and None is returned.
+        The modifications closed are appended to tour.journal if it is kept. """
+    length = tour.tour_length()
+    (road, backward) = tour.start
+    cities = list(road)
+    done = []
+    for (city, road_add, road_rm) in mods:
+        if check and not (other(road_add, city) == tour.last and tour.prev_city(tour.last) != city and
+                          tour.next_city(city) == other(road_rm, city)):
+            break
+        tour.modify(city, road_add, road_rm)
+        done.append((city, road_add, road_rm))
+        cities.extend(road_add)
+        cities.extend(road_rm)
+    if check and (len(done) < len(mods) or not shorter(tour.tour_length(), length)):
+        for mod in reversed(done):
+            tour.unmodify(*mod)
+        tour.path2tour()
+        return None
+    cities.extend((tour.first, tour.last))
+    if tour.journal is not None:
+        tour.journal.append((tour.start, tour.first, tour.last, done))
+    tour.close()
+    return cities
+
+
+def tour_improve(tour, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None, observer=None,
+                 start_cities=None, quiet=False, search=None):
+
+    """ Improve the tour in place with Lin-Kernighan-ish path searches,
+        using don't-look bits : only the cities in a queue are searched from,
+        at first all the cities (or start_cities) in the tour order.
+        For a city, the tour is converted to each of the two paths ending
+        with it, and a path search is run on it.  The first improvement found
+        is kept, and the cities at the ends of the roads it changed are queued
+        again ; the others cities keep their don't-look bit until then.
+        Stops when the queue is empty, no search improving the tour anymore.
+        Return the tour and the number of the search which last improved it.
+        If given, observer(tour, iteration, iterations, best_iteration)
+        is called after each city, iterations being the searches expected.
+        The progress lines are not printed if quiet is set.
+        The path searches are done by search (see default_search). """
+    if search is None:
+        search = default_search(tour)
+    queue = deque()
+    queued = set()
+    queue_cities(queue, queued, tour.city_sequence() if start_cities is None else start_cities)
+    if not quiet:
+        print "===== starting tour_improve with %i cities to check" % len(queue)
+    (begin, start_length) = (time.time(), tour.tour_length())
+    i = 0
+    improvements = 0
+    best_iteration = 0
+    while queue:
+        city = queue.popleft()
+        queued.remove(city)
+        for (road, backward) in city_starts(tour, city):
+            i += 1
+            length = tour.tour_length()
+            tour.tour2path(road, backward)
+            (found, mods) = search(tour, lk_max_search_roads, lk_verbose, lk_depth_limit)
+            if shorter(found, length):
+                queue_cities(queue, queued, apply_mods(tour, mods))
+                best_iteration = i
+                improvements += 1
+                if not quiet:
+                    print "---- path_search %i from %s improved the tour to %f (%i cities queued)" % \
+                          (i, tour.all_cities.names[city], tour.tour_length(), len(queue))
+                break
+            tour.path2tour()
+        if observer:
+            observer(tour, i, i + 2 * len(queue), best_iteration)
+    if tour.stats is not None:
+        tour.stats.add_pass(i, improvements, start_length - tour.tour_length(), time.time() - begin)
+    if not quiet:
+        print "===== finished tour_improve after %i path searches; best is %s " % (i, str(tour))
+    return tour, best_iteration
+
+
+def path_search(path, added, deleted, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
+    """ Recursive part of search for an improved TSP solution.
+        The path is modified and restored in place ; only the best tour length
+        found is kept, with the list of (city, road_add, road_rm) modifications
+        leading to it from the path, and returned as (length, modifications). """
+    depth = len(added)  # also = len(deleted)
+    if path.stats is not None:
+        path.stats.count_node(depth)
+    old_tour_length = path.tour_length()
+    (best_length, best_mods) = (old_tour_length, [])
+    mods = path.find_lk_mods(lk_max_search_roads, added, deleted)
+
+    if lk_verbose:
+        print " " * depth + "  -- path_search " + \
+              " depth=%i, path=%f, tour=%f, n_mods=%i " % \
+              (depth, path.length, old_tour_length, len(mods))
+
+    for (city, road_add, road_rm) in mods:
+
+        if lk_verbose:
+            print " " * depth + "  -> (city, road_add, road_rm) = (%s, %s, %s) " % \
+                                (str(city), str(road_add), str(road_rm))
+
+        path.modify(city, road_add, road_rm)
+
+        if lk_verbose:
+            print " " * depth + "  -> modified path %s " % str(path)
+
+        added.append(road_add)
+        deleted.append(road_rm)
+
+        if lk_depth_limit and depth > lk_depth_limit:
+            (result_length, result_mods) = (path.tour_length(), [])
+        else:
+            (result_length, result_mods) = path_search(path, list(added), list(deleted),
+                                                       lk_max_search_roads, lk_verbose, lk_depth_limit)
+        if result_length < best_length:
+            (best_length, best_mods) = (result_length, [(city, road_add, road_rm)] + result_mods)
+
+        if lk_verbose:
+            print " " * depth + "  -> result tour=%f" % result_length
+
+        added.pop()
+        deleted.pop()
+
+        path.unmodify(city, road_add, road_rm)
+
+    # Finished breadth search at this depth ; return best result
+    return best_length, best_mods
+
+
+def table_path_search(path, added, deleted, lk_max_search_roads, lk_depth_limit=None, key=0):
+    """ path_search with the transposition table of the path : the result
+        of a path state searched before from the same start is returned
+        instead of searching it again ; key is the xor of the table move_key
+        of the modifications done since the start.  Kept apart from
+        path_search, so that the searches without a table don't pay for it. """
+    depth = len(added)
+    table = path.transpositions
+    if depth == 0:
+        table.start()
+    state = table.state_key(key, path.last)
+    result = table.get(state)
+    if result is not None:
+        return result
+    if path.stats is not None:
+        path.stats.count_node(depth)
+    (best_length, best_mods) = (path.tour_length(), [])
+    for (city, road_add, road_rm) in path.find_lk_mods(lk_max_search_roads, added, deleted):
+        path.modify(city, road_add, road_rm)
+        added.append(road_add)
+        deleted.append(road_rm)
+        if lk_depth_limit and depth > lk_depth_limit:
+            (result_length, result_mods) = (path.tour_length(), [])
+        else:
+            (result_length, result_mods) = table_path_search(path, list(added), list(deleted), lk_max_search_roads,
+                                                             lk_depth_limit, key ^ table.move_key(road_add, road_rm))
+        if result_length < best_length:
+            (best_length, best_mods) = (result_length, [(city, road_add, road_rm)] + result_mods)
+        added.pop()
+        deleted.pop()
+        path.unmodify(city, road_add, road_rm)
+    table.put(state, (best_length, best_mods))
+    return best_length, best_mods
+
+
+def recursive_search(path, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
+    """ The path search of tour_improve : path_search from the path,
+        keeping the best of all the tours found. """
+    return path_search(path, [], [], lk_max_search_roads, lk_verbose, lk_depth_limit)
+
+
+def transposition_search(path, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
+    """ recursive_search with the transposition table of the path
+        (see table_path_search) ; lk_verbose is not used. """
+    return table_path_search(path, [], [], lk_max_search_roads, lk_depth_limit)
+
+
+def default_search(tour):
+    """ The search of tour_improve when none is given : recursive_search,
+        or transposition_search if the tour has a transposition table. """
+    return recursive_search if tour.transpositions is None else transposition_search
+
+
+def breadth_list(value):
+    """ Parse the breadths of IterativeSearch, as 5,5,3,2,1. """
+    breadth = [int(width) for width in value.split(',')]
+    if not breadth or min(breadth) < 1:
+        raise ValueError("The breadths must be positive.")
+    return breadth
+
+
+class IterativeSearch(object):
+    """ The same search as path_search, depth first along the modifications
+        of find_lk_mods, with an explicit stack instead of recursion :
+
+          self.mods[depth]        = modifications to try at depth
+          self.positions[depth]   = index of the next one to try
+          self.moves[depth]       = modification done at depth
+
+        These buffers are kept from one search to the next, and the added
+        and deleted roads lists are shared by all depths instead of copied.
+
+        At most breadth[depth] modifications are tried at each depth (the
+        last breadth for the deeper ones), all of them if breadth is None.
+        With first_improvement, the search stops at the first modification
+        making the tour shorter than the path's tour ; otherwise, the best
+        tour of the whole search is kept, as path_search does.
+        lk_verbose and the transposition table of the path are not used.
+    """
+
+    def __init__(self, breadth=None, first_improvement=False):
+        self.breadth = tuple(breadth) if breadth else None
+        self.first_improvement = first_improvement
+        self.mods = [None] * 16
+        self.positions = [0] * 16
+        self.moves = [None] * 16
+
+    def __getstate__(self):
+        """ Only the options are sent to the pool workers, not the buffers. """
+        return {'breadth': self.breadth, 'first_improvement': self.first_improvement}
+
+    def __setstate__(self, state):
+        self.__init__(state['breadth'], state['first_improvement'])
+
+    def width(self, depth):
+        breadth = self.breadth
+        return breadth[depth] if depth < len(breadth) else breadth[-1]
+
+    def push(self, path, depth, lk_max_search_roads, added, deleted):
+        """ Put the modifications of the path at depth on the stack. """
+        if depth == len(self.mods):
+            for buffer in (self.mods, self.positions, self.moves):
+                buffer.extend([buffer[0]] * len(buffer))
+        if path.stats is not None:
+            path.stats.count_node(depth)
+        mods = path.find_lk_mods(lk_max_search_roads, added, deleted)
+        if self.breadth is not None:
+            del mods[self.width(depth):]
+        self.mods[depth] = mods
+        self.positions[depth] = 0
+
+    def __call__(self, path, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
+        """ Search from the path, restored in place ; return the tour length
+            found and the modifications leading to it, as path_search. """
+        (mods, positions, moves) = (self.mods, self.positions, self.moves)
+        (added, deleted) = ([], [])
+        start_length = path.tour_length()
+        (best_length, best_mods) = (start_length, [])
+        self.push(path, 0, lk_max_search_roads, added, deleted)
+        depth = 0
+        while depth >= 0:
+            k = positions[depth]
+            if k == len(mods[depth]):
+                # All the modifications at this depth were tried : undo the one before.
+                mods[depth] = None
+                depth -= 1
+                if depth >= 0:
+                    path.unmodify(*moves[depth])
+                    added.pop()
+                    deleted.pop()
+                continue
+            positions[depth] = k + 1
+            move = mods[depth][k]
+            path.modify(*move)
+            moves[depth] = move
+            added.append(move[1])
+            deleted.append(move[2])
+            length = path.tour_length()
+            if length < best_length:
+                (best_length, best_mods) = (length, moves[:depth + 1])
+                if self.first_improvement and shorter(length, start_length):
+                    break
+            if lk_depth_limit and depth > lk_depth_limit:
+                path.unmodify(*move)
+                added.pop()
+                deleted.pop()
+            else:
+                depth += 1
+                self.push(path, depth, lk_max_search_roads, added, deleted)
+        else:
+            return best_length, best_mods
+        # Stopped at the first improvement : undo the modifications done.
+        for d in range(depth, -1, -1):
+            path.unmodify(*moves[d])
+            mods[d] = None
+        return best_length, best_mods
@@ -0,0 +1,142 @@
+import os
+import re
+import csv
+import json
+from array import array
+from itertools import islice, imap
+import numpy
+from cities import Cities, metrics
+
+# The distances of TSPLIB problems which can be read.
+tsplib_metrics = ('EUC_2D', 'CEIL_2D', 'GEO', 'ATT')
+
+# Input files of this size (in bytes) or more are cached by default.
+cache_min_size = 1 << 20
+
+# Changed when the cache format changes, so that old caches are parsed again.
+cache_version = 2
+
+# Rows of a csv file converted at a time.
+chunk_rows = 1 << 16
+
+
+def load(filename, cache=None):
+    """ Return the Cities of a CSV file (name,x,y rows) or TSPLIB file.
+        If cache is set (by default, for files of cache_min_size bytes or more)
+        the parsed cities are saved in a binary file next to the input,
+        which is memory-mapped instead of parsing the input again
+        as long as the input file is not modified (see load_cache). """
+    if cache is None:
+        cache = os.path.getsize(filename) >= cache_min_size
+    if cache:
+        cities = load_cache(filename)
+        if cities is not None:
+            return cities
+    cities = parse(filename)
+    if cache:
+        save_cache(filename, cities)
+    return cities
+
+
+def parse(filename):
+    with open(filename, 'rb') as input_file:
+        head = input_file.readline()
+        if filename.lower().endswith('.tsp') or re.match(r'\s*NAME\s*:', head):
+            return parse_tsplib(head + input_file.read())
+        input_file.seek(0)
+        return parse_csv(input_file)
+
+
+def parse_csv(lines):
+    """ Read the name,x,y rows of lines (an open file or a list of lines) ;
+        the coordinates may be integers or floats, the names may be quoted
+        and contain commas.  The rows are read chunk_rows at a time, and
+        their coordinates appended to arrays of doubles : only the names
+        are kept as a list of strings, not the text or the rows. """
+    rows = imap(csv_row, csv.reader(line for line in lines if line.strip()))
+    names = []
+    (x, y) = (array('d'), array('d'))
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            break
+        (chunk_names, chunk_x, chunk_y) = zip(*chunk)
+        names.extend(chunk_names)
+        x.extend(map(float, chunk_x))
+        y.extend(map(float, chunk_y))
+    return Cities(names, x, y)
+
+
+def csv_row(row):
+    if len(row) != 3:
+        raise ValueError("Expected name,x,y rows in the csv file.")
+    return row
+
+
+def parse_tsplib(text):
+    """ Read a TSPLIB problem : 'KEY : value' header lines, then
+        the 'number x y' lines of the NODE_COORD_SECTION. """
+    (head, section, body) = text.partition('NODE_COORD_SECTION')
+    if not section:
+        raise ValueError("No NODE_COORD_SECTION in the TSPLIB file.")
+    header = {}
+    for line in head.splitlines():
+        if ':' in line:
+            (key, value) = line.split(':', 1)
+            header[key.strip().upper()] = value.strip()
+    metric = header.get('EDGE_WEIGHT_TYPE', 'EUC_2D').upper()
+    if metric not in tsplib_metrics:
+        raise ValueError("Unsupported EDGE_WEIGHT_TYPE %s, expected one of %s." % (metric, ", ".join(tsplib_metrics)))
+    # The coordinates end with EOF or the next section.
+    end = re.search(r'[A-Z_]{3,}', body)
+    fields = (body[:end.start()] if end else body).split()
+    if len(fields) % 3:
+        raise ValueError("Expected 'number x y' lines in NODE_COORD_SECTION.")
+    if 'DIMENSION' in header and int(header['DIMENSION']) != len(fields) // 3:
+        raise ValueError("DIMENSION is %s but there are %i cities." % (header['DIMENSION'], len(fields) // 3))
+    return metrics[metric](fields[0::3], numpy.array(fields[1::3], dtype=float),
+                           numpy.array(fields[2::3], dtype=float))
+
+
+def cache_files(filename):
+    return filename + '.cache.npy', filename + '.cache.json'
+
+
+def source_stamp(filename):
+    """ What identifies the version of the input file a cache was made from. """
+    status = os.stat(filename)
+    return {'size': status.st_size, 'mtime': status.st_mtime, 'version': cache_version}
+
+
+def load_cache(filename):
+    """ Return the Cities saved by save_cache, or None if there is no cache
+        or if it was made from another version of the file.  The names stay
+        in the memory-mapped file ; the coordinates are copied from it once
+        into the arrays of doubles of the Cities, which the path search
+        reads faster than NumPy arrays. """
+    (data_file, info_file) = cache_files(filename)
+    try:
+        with open(info_file) as info:
+            info = json.load(info)
+        if info['source'] != source_stamp(filename):
+            return None
+        data = numpy.load(data_file, mmap_mode='r')
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    return metrics[info['metric']](data['name'], data['x'], data['y'])
+
+
+def save_cache(filename, cities):
+    """ Save the cities in one array of (name, x, y) records,
+        which numpy.load can memory-map. """
+    (data_file, info_file) = cache_files(filename)
+    names = numpy.array(cities.names)
+    data = numpy.empty(len(cities), dtype=[('name', names.dtype), ('x', float), ('y', float)])
+    data['name'] = names
+    (data['x'], data['y']) = cities.arrays()
+    try:
+        numpy.save(data_file, data)
+        with open(info_file, 'w') as info:
+            json.dump({'source': source_stamp(filename), 'metric': cities.metric, 'count': len(cities)}, info)
+    except (IOError, OSError) as error:
+        print "Could not cache the cities in %s : %s" % (data_file, error)
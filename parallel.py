@@ -0,0 +1,203 @@
+import time
+import multiprocessing
+from tour import Tour
+from stats import SearchStats, enable
+from transposition import TranspositionTable
+from lk import city_starts, path_start, queue_cities, apply_mods, default_search, shorter
+
+# The tour class of a worker process, set once by _init_worker, and the
+# tour of the last round it searched, kept for the next tasks of the round.
+_worker = {}
+
+
+def _init_worker(cities, roads, tour_class, stats, table_size):
+    """ Set the cities and their candidate roads in a worker process,
+        start collecting the search statistics if stats is set,
+        and use a transposition table of table_size states if given. """
+    Tour.all_cities = cities
+    Tour.roads = roads
+    Tour.stats = None
+    Tour.transpositions = TranspositionTable(table_size) if table_size else None
+    if stats:
+        enable(tour_class)
+    _worker['tour_class'] = tour_class
+
+
+def _round_tour(round_key, order):
+    """ Return the tour of the round, built from its order by the first
+        task of the round done in this worker : the path searches leave it
+        unchanged, but for the rounding errors of its length, which is set
+        back to _worker['length'] before each search. """
+    if _worker.get('round') != round_key:
+        tour = _worker['tour_class'](order)
+        _worker.update(round=round_key, tour=tour, length=tour.tour_length())
+    return _worker['tour']
+
+
+def _search_cities(task):
+    """ Run the path searches from the given cities of a tour,
+        leaving the tour unchanged.  Return the count of searches,
+        for each city with an improving search, the path found
+        as (city, first city, modifications, count of searches up to it)
+        and the search statistics
+        and transposition table counts of the task (None if not used). """
+    (round_key, order, batch, lk_max_search_roads, lk_verbose, lk_depth_limit, search) = task
+    tour = _round_tour(round_key, order)
+    count = 0
+    found = []
+    for city in batch:
+        for (road, backward) in city_starts(tour, city):
+            count += 1
+            length = tour.length = _worker['length']
+            tour.tour2path(road, backward)
+            (search_length, mods) = search(tour, lk_max_search_roads, lk_verbose, lk_depth_limit)
+            first = tour.first
+            tour.path2tour()
+            if shorter(search_length, length):
+                found.append((city, first, mods, count))
+                break
+    counts = None
+    if Tour.stats is not None:
+        counts = Tour.stats.as_dict()
+        Tour.stats = SearchStats()
+    table_counts = None
+    if Tour.transpositions is not None:
+        table_counts = Tour.transpositions.counts()
+        Tour.transpositions = TranspositionTable(Tour.transpositions.size)
+    return count, found, counts, table_counts
+
+
+class TourPool(object):
+    """ A pool of worker processes sharing the path searches of tour_improve.
+        The cities and their candidate roads (those of the Problem if given,
+        else Tour.roads) are sent once to each worker when it starts ;
+        each task only carries the tour order and some of the queued cities,
+        about chunks_per_worker tasks per worker and round.
+
+        The searches are done in rounds : the workers search from the first
+        queued cities on the tour as it was at the beginning of the round,
+        then the improvements found are replayed on the tour, in the queue
+        order, if they are still valid.  The more improvements found on the
+        same tour, the more of them overlap and can't be replayed : a round
+        takes about improvements_per_round divided by the recent fraction of
+        the searched cities which improved the tour (or couldn't be replayed),
+        and at most round_fraction of the cities.  While the tour improves
+        from most cities, as from a random tour, that is a single city : it
+        is searched in this process on the tour itself, as lk.tour_improve
+        does, until the queue settles.
+        The rounds and the replay order don't depend on the number of workers,
+        so neither does the tour found, even with one worker ; it is not the
+        tour of lk.tour_improve, which searches from one city at a time on
+        the tour improved so far. """
+
+    chunks_per_worker = 4
+    round_fraction = 0.1
+    improvements_per_round = 4
+    min_round = 32
+    # Weight of the last searched city in the moving fraction of improving ones.
+    rate_weight = 1.0 / 32
+
+    def __init__(self, cities, tour_class, workers, problem=None):
+        self.cities = cities
+        self.workers = workers
+        self.rounds = 0
+        if problem is None:
+            (roads, stats, table) = (Tour.roads, Tour.stats, Tour.transpositions)
+        else:
+            (roads, stats, table) = (problem.roads, problem.stats, problem.transpositions)
+        self.pool = multiprocessing.Pool(workers, _init_worker, (cities, roads, tour_class, stats is not None,
+                                                                 table.size if table is not None else None))
+
+    def tour_improve(self, tour, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None, observer=None,
+                     start_cities=None, quiet=False, search=None):
+        """ Same as lk.tour_improve, with the path searches run by the workers.
+            The cities whose improvement can't be replayed anymore
+            are queued for the next round, with the ends of the changed roads. """
+        if search is None:
+            search = default_search(tour)
+        queue = []
+        queued = set()
+        queue_cities(queue, queued, tour.city_sequence() if start_cities is None else start_cities)
+        if not quiet:
+            print "===== starting tour_improve with %i cities to check on %i workers" % (len(queue), self.workers)
+        (begin, start_length) = (time.time(), tour.tour_length())
+        i = 0
+        improvements = 0
+        best_iteration = 0
+        max_round = max(1, int(self.round_fraction * len(self.cities)))
+        rate = 1.0
+        while queue:
+            if rate * max_round <= self.improvements_per_round:
+                round_size = max_round
+            else:
+                round_size = max(1, int(self.improvements_per_round / rate))
+            if round_size < self.min_round:
+                city = queue.pop(0)
+                queued.discard(city)
+                improved = False
+                for (road, backward) in city_starts(tour, city):
+                    i += 1
+                    length = tour.tour_length()
+                    tour.tour2path(road, backward)
+                    (found, mods) = search(tour, lk_max_search_roads, lk_verbose, lk_depth_limit)
+                    if shorter(found, length):
+                        queue_cities(queue, queued, apply_mods(tour, mods))
+                        best_iteration = i
+                        improvements += 1
+                        improved = True
+                        if not quiet:
+                            print "---- path_search %i from %s improved the tour to %f (%i cities queued)" % \
+                                  (i, tour.all_cities.names[city], tour.tour_length(), len(queue))
+                        break
+                    tour.path2tour()
+                rate += self.rate_weight * (improved - rate)
+                if observer:
+                    observer(tour, i, i + 2 * len(queue), best_iteration)
+                continue
+            order = tour.city_sequence()
+            self.rounds += 1
+            batch = queue[:round_size]
+            queue = queue[round_size:]
+            queued = set(queue)
+            (improved, missed) = (0, 0)
+            size = max(1, -(-len(batch) // (self.workers * self.chunks_per_worker)))
+            tasks = [(self.rounds, order, batch[first:first + size], lk_max_search_roads, lk_verbose,
+                      lk_depth_limit, search) for first in range(0, len(batch), size)]
+            for (count, found, counts, table_counts) in self.pool.imap(_search_cities, tasks):
+                if counts is not None:
+                    tour.stats.merge(counts)
+                if table_counts is not None:
+                    tour.transpositions.merge(table_counts)
+                for (city, first, mods, searches) in found:
+                    start = path_start(tour, city, first)
+                    changed = None
+                    if start:
+                        tour.tour2path(*start)
+                        changed = apply_mods(tour, mods, check=True)
+                    if changed:
+                        queue_cities(queue, queued, changed)
+                        best_iteration = i + searches
+                        improvements += 1
+                    else:
+                        queue_cities(queue, queued, [city])
+                        missed += 1
+                i += count
+                improved += len(found)
+            # As many moves of the rate as cities searched, towards the fraction
+            # of the round, where the improvements not replayed count twice.
+            weight = 1 - (1 - self.rate_weight) ** len(batch)
+            rate += weight * (float(improved + missed) / len(batch) - rate)
+            if not quiet:
+                print "---- done %i path_search; tour length=%f (%i cities queued)" % \
+                      (i, tour.tour_length(), len(queue))
+            if observer:
+                observer(tour, i, i + 2 * len(queue), best_iteration)
+        if tour.stats is not None:
+            tour.stats.add_pass(i, improvements, start_length - tour.tour_length(), time.time() - begin)
+        if not quiet:
+            print "===== finished tour_improve after %i path searches; best is %s " % (i, str(tour))
+        return tour, best_iteration
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
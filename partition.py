@@ -0,0 +1,280 @@
+import time
+import multiprocessing
+import numpy
+from cities import metrics
+from problem import Problem
+from roads import Roads
+from kdtree import KDTree
+from construction import build_tour, UnionFind
+from preopt import pre_optimize
+from lk import tour_improve
+from parallel import TourPool
+
+# Spatial decomposition of very large instances : the cities are cut into
+# tiles of at most tile_size cities by median cuts (Karp's partitioning),
+# the tour of each tile is solved as a separate instance, in parallel,
+# the tile tours are joined by exchanging roads along the seams between
+# tiles, then LK repairs the tour from the cities along the seams only.
+
+
+def kd_tiles(cities, size):
+    """ Return the arrays of the cities indices of the tiles : the cities
+        are cut in two halves at the median of their widest axis,
+        and the halves again, until they have at most size cities. """
+    (x, y) = cities.arrays()
+    tiles = []
+    stack = [numpy.arange(len(cities))]
+    while stack:
+        indices = stack.pop()
+        if len(indices) <= size:
+            tiles.append(indices)
+            continue
+        (xs, ys) = (x[indices], y[indices])
+        values = xs if xs.ptp() >= ys.ptp() else ys
+        middle = len(indices) // 2
+        halves = numpy.argpartition(values, middle)
+        stack.append(indices[halves[middle:]])
+        stack.append(indices[halves[:middle]])
+    return tiles
+
+
+def tile_roads(roads, tile, n):
+    """ Return the start and others arrays (as in Roads) of the candidate
+        roads between the cities of the tile, numbered by their index in it. """
+    (start, others) = roads.arrays()
+    local = numpy.full(n, -1, dtype=int)
+    local[tile] = numpy.arange(len(tile))
+    counts = numpy.diff(start)[tile]
+    rows = numpy.repeat(numpy.arange(len(tile)), counts)
+    # The positions in others of the candidates of the tile cities, row by row.
+    positions = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + \
+        numpy.repeat(start[tile], counts)
+    tile_others = local[others[positions]]
+    inside = tile_others >= 0
+    tile_start = numpy.zeros(len(tile) + 1, dtype=int)
+    tile_start[1:] = numpy.cumsum(numpy.bincount(rows[inside], minlength=len(tile)))
+    return tile_start, tile_others[inside]
+
+
+def solve_tile(task):
+    """ Solve the tour of the cities at the coordinates x, y, with the
+        candidate roads of the arrays start and others, as a separate instance ;
+        return its order (indices in x and y), its length and the time taken.
+        Run by the pool workers of tiled_tour. """
+    (x, y, start, others, metric, options) = task
+    begin = time.time()
+    cities = metrics[metric]([str(i) for i in range(len(x))], x, y)
+    n = len(cities)
+    if n < 5:
+        order = range(n)
+        length = sum(cities.distance(order[i - 1], order[i]) for i in range(n)) if n > 1 else 0.0
+        return order, length, time.time() - begin
+    roads = Roads.from_arrays(start, others)
+    tour = build_tour(options['init'], cities, options['tour_class'], Problem(cities, roads))
+    if options['pre_opt']:
+        tour = pre_optimize(options['pre_opt'], tour)[0]
+    tour = tour_improve(tour, options['neighbors'], False, options['depth'], quiet=True, search=options['search'])[0]
+    return tour.city_sequence(), tour.tour_length(), time.time() - begin
+
+
+class TileTours(object):
+    """ The tours of the tiles as directed cycles in two arrays,
+        self.next[city] and self.prev[city], to be joined into one tour. """
+
+    def __init__(self, n, tiles, tile_orders):
+        self.next = numpy.empty(n, dtype=int)
+        self.prev = numpy.empty(n, dtype=int)
+        self.tile_of = numpy.empty(n, dtype=int)
+        self.sizes = {}
+        for (k, (tile, order)) in enumerate(zip(tiles, tile_orders)):
+            self.next[order] = numpy.roll(order, -1)
+            self.prev[order] = numpy.roll(order, 1)
+            self.tile_of[tile] = k
+            self.sizes[k] = len(tile)
+        self.components = UnionFind(len(tiles))
+        (self.next, self.prev) = (self.next.tolist(), self.prev.tolist())
+
+    def reverse(self, city):
+        """ Reverse the direction of the cycle of city. """
+        (next_city, prev_city) = (self.next, self.prev)
+        start = city
+        while True:
+            following = next_city[city]
+            (next_city[city], prev_city[city]) = (prev_city[city], following)
+            city = following
+            if city == start:
+                break
+
+    def join(self, a, a2, c, c2):
+        """ Join the cycles of the roads (a, a2) and (c, c2) into one,
+            replacing these roads by (a, c) and (a2, c2) ; return False
+            if they are no longer roads of two different cycles. """
+        (ka, kc) = (self.components.find(self.tile_of[a]), self.components.find(self.tile_of[c]))
+        if ka == kc or a2 not in (self.next[a], self.prev[a]) or c2 not in (self.next[c], self.prev[c]):
+            return False
+        (size_a, size_c) = (self.sizes.pop(ka), self.sizes.pop(kc))
+        if self.next[a] != a2:
+            (a, a2, c, c2) = (a2, a, c2, c)
+        # Going from a to c, the cycle of c must then lead to c2 : reverse
+        # the smaller cycle if it doesn't.
+        if self.next[c] == c2:
+            if size_a < size_c:
+                self.reverse(a)
+                (a, a2, c, c2) = (a2, a, c2, c)
+            else:
+                self.reverse(c)
+        (self.next[a], self.prev[c], self.next[c2], self.prev[a2]) = (c, a, a2, c2)
+        self.components.union(ka, kc)
+        self.sizes[self.components.find(ka)] = size_a + size_c
+        return True
+
+    def order(self, start=0):
+        """ Return the cities along the cycle of start. """
+        order = [start]
+        city = self.next[start]
+        while city != start:
+            order.append(city)
+            city = self.next[city]
+        return order
+
+
+def join_tiles(cities, roads, tiles, tile_orders):
+    """ Join the tours of the tiles into one tour order, two at a time :
+        a road (a, a2) of one tour and a road (c, c2) of another are replaced
+        by (a, c) and (a2, c2), (a, c) being a candidate road between tiles,
+        the cheapest exchanges first.  Return the order and the cities at
+        the ends of the roads exchanged. """
+    n = len(cities)
+    tours = TileTours(n, tiles, tile_orders)
+    tile_of = tours.tile_of
+    (start, others) = roads.arrays()
+    owners = numpy.repeat(numpy.arange(n), numpy.diff(start[:n + 1]))
+    others = others[:len(owners)]
+    crossing = (owners < others) & (tile_of[owners] != tile_of[others])
+    (cost, a, a2, c, c2) = exchanges(cities, tours, owners[crossing], others[crossing])
+    ends = []
+    joins = len(tiles) - 1
+    for k in numpy.argsort(cost, kind='mergesort'):
+        if not joins:
+            break
+        if tours.join(a[k], a2[k], c[k], c2[k]):
+            ends.extend((a[k], a2[k], c[k], c2[k]))
+            joins -= 1
+    if joins:
+        ends.extend(join_nearest(cities, tours, tiles))
+    return tours.order(), [int(city) for city in ends]
+
+
+def exchanges(cities, tours, a, c):
+    """ Return the arrays (cost, a, a2, c, c2) of the four exchanges of
+        the roads (a, a2) and (c, c2) around each pair of cities (a, c). """
+    (next_city, prev_city) = (numpy.array(tours.next), numpy.array(tours.prev))
+    moves = []
+    for a2 in (next_city[a], prev_city[a]):
+        for c2 in (next_city[c], prev_city[c]):
+            cost = (cities.distances(a, c) + cities.distances(a2, c2) -
+                    cities.distances(a, a2) - cities.distances(c, c2))
+            moves.append((cost, a, a2, c, c2))
+    return [numpy.concatenate(column) for column in zip(*moves)]
+
+
+def join_nearest(cities, tours, tiles):
+    """ Join the cycles left by join_tiles, whose tiles have no candidate
+        road to the others (far away clusters) : the smallest cycle is
+        joined to another one by the cheapest exchange around its cities
+        and their nearest cities outside it, until one cycle is left.
+        Return the cities at the ends of the roads exchanged. """
+    tree = KDTree(cities.points())
+    (x, y) = cities.arrays()
+    ends = []
+    while len(tours.sizes) > 1:
+        component = min(tours.sizes, key=lambda k: (tours.sizes[k], k))
+        tile = next(tile for (k, tile) in enumerate(tiles) if tours.components.find(k) == component)
+        inside = tours.order(tile[0])
+        for city in inside:
+            tree.remove(city)
+        nearest = [tree.nearest(x[city], y[city], 1)[0] for city in inside]
+        for city in inside:
+            tree.insert(city)
+        (cost, a, a2, c, c2) = exchanges(cities, tours, numpy.array(inside), numpy.array(nearest))
+        k = numpy.argmin(cost)
+        tours.join(a[k], a2[k], c[k], c2[k])
+        ends.extend((a[k], a2[k], c[k], c2[k]))
+    return ends
+
+
+def seam_cities(roads, tiles, n):
+    """ Return the cities having a candidate road to a city of another tile. """
+    tile_of = numpy.empty(n, dtype=int)
+    for (k, tile) in enumerate(tiles):
+        tile_of[tile] = k
+    (start, others) = roads.arrays()
+    owners = numpy.repeat(numpy.arange(n), numpy.diff(start[:n + 1]))
+    return numpy.unique(owners[tile_of[owners] != tile_of[others[:len(owners)]]])
+
+
+def tiled_tour(problem, tour_class, tile_size, neighbors=3, init='greedy', pre_opt=None, depth=None, workers=None,
+               search=None):
+    """ Return the tour of the cities of the problem solved by tiles of at most
+        tile_size cities (on a pool of workers processes), with the candidate
+        roads of the problem inside each tile, joined and repaired
+        along the seams, and the report of the stages as a list of
+        (stage, seconds, length, note) : the total length of the tiles tours
+        after 'tiles', the tour length after 'join' and 'repair'. """
+    cities = problem.cities
+    stages = []
+    begin = time.time()
+    tiles = kd_tiles(cities, tile_size)
+    stages.append(('partition', time.time() - begin, None,
+                   "%i tiles of %i to %i cities" % (len(tiles), min(map(len, tiles)), max(map(len, tiles)))))
+
+    begin = time.time()
+    (x, y) = cities.arrays()
+    options = {'neighbors': neighbors, 'init': init, 'pre_opt': pre_opt,
+               'depth': depth, 'tour_class': tour_class, 'search': search}
+    tasks = [(x[tile].copy(), y[tile].copy()) + tile_roads(problem.roads, tile, len(cities)) + (cities.metric, options)
+             for tile in tiles]
+    if workers and workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(solve_tile, tasks, chunksize=1)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = map(solve_tile, tasks)
+    tile_orders = [tile[numpy.array(order, dtype=int)] for (tile, (order, length, seconds)) in zip(tiles, results)]
+    stages.append(('tiles', time.time() - begin, sum(length for (order, length, seconds) in results),
+                   "the longest tile took %f seconds" % max(seconds for (order, length, seconds) in results)))
+
+    begin = time.time()
+    (order, ends) = join_tiles(cities, problem.roads, tiles, tile_orders)
+    tour = tour_class(order, problem)
+    stages.append(('join', time.time() - begin, tour.tour_length(), "%i exchanges" % (len(tiles) - 1)))
+
+    begin = time.time()
+    seams = set(seam_cities(problem.roads, tiles, len(cities)).tolist())
+    seams.update(ends)
+    start_cities = [city for city in order if city in seams]
+    pool = TourPool(cities, tour_class, workers, problem) if workers else None
+    try:
+        improve = pool.tour_improve if pool else tour_improve
+        tour = improve(tour, neighbors, False, depth, start_cities=start_cities, quiet=True, search=search)[0]
+    finally:
+        if pool:
+            pool.close()
+    stages.append(('repair', time.time() - begin, tour.tour_length(),
+                   "LK from %i seam cities" % len(start_cities)))
+    return tour, stages
+
+
+def stages_report(stages):
+    """ Return the lines of the report of the tiled_tour stages. """
+    lines = []
+    for (stage, seconds, length, note) in stages:
+        line = "%-9s : %10.3f seconds" % (stage, seconds)
+        if length is not None:
+            line += ", length %f" % length
+        lines.append("%s (%s)" % (line, note))
+    return lines
@@ -0,0 +1,57 @@
+import time
+import warnings
+from matplotlib import pyplot as plt
+
+
+class TourPlot(object):
+    """ Live figure of the best tour found by tour_improve.
+        The cities are plotted once ; the tour is a single line
+        whose data is replaced, at most every 'interval' seconds,
+        so drawing does not slow down the search on large datasets.
+        Used as the observer of tour_improve. """
+
+    # Above this count, city names would only hide the tour.
+    max_annotations = 200
+
+    def __init__(self, cities, interval=1.0):
+        """ cities is the Cities of the tours to draw. """
+        self.interval = interval
+        (self.x, self.y) = cities.arrays()
+        self.last_draw = None
+        (self.iterations, self.best_iteration) = (0, 0)
+        # Ignore matplotlib warnings related to GUI
+        warnings.filterwarnings("ignore", ".*GUI.*")
+        self.figure = plt.figure()
+        plt.plot(self.x, self.y, 'co')
+        if len(cities) <= self.max_annotations:
+            for (name, x, y) in zip(cities.names, cities.x, cities.y):
+                plt.annotate(name, xy=(x, y), xytext=(5, 5), textcoords='offset points')
+        (self.line,) = plt.plot([], [], 'r-')
+        plt.show(block=False)
+
+    def __call__(self, tour, iteration, iterations, best_iteration, force=False):
+        """ Redraw the tour, unless it was drawn less than 'interval' seconds ago. """
+        (self.iterations, self.best_iteration) = (iterations, best_iteration)
+        now = time.time()
+        if not force and self.last_draw is not None and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+        self.draw(tour.city_sequence(), tour.tour_length(), iteration, iterations, best_iteration)
+
+    def draw(self, order, length, iteration, iterations, best_iteration):
+        closed = list(order) + [order[0]]
+        self.line.set_data(self.x[closed], self.y[closed])
+        self.figure.suptitle('Actual iteration : ' + str(iteration) + '/' + str(iterations) +
+                             '\n Best tour found on iteration : '
+                             + str(best_iteration) + ', Tour length : ' + str(length), fontsize=12)
+        self.figure.canvas.draw_idle()
+        self.figure.canvas.flush_events()
+
+    def finish(self, order, length):
+        """ Draw the final tour, the cities indices along it, with the last
+            iterations seen, and wait for the figure to be closed. """
+        self.draw(order, length, self.iterations, self.iterations, self.best_iteration)
+        ax = self.figure.gca()
+        plt.text(0.5, -0.1, 'Finished, Close this window to stop the program.', horizontalalignment='center',
+                 verticalalignment='center', transform=ax.transAxes, color='green', weight='bold')
+        plt.show(block=True)
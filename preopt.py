@@ -0,0 +1,260 @@
+import numpy
+from lk import epsilon, shorter
+
+# A cheap local search run on the initial tour before the LK search :
+# the 2-opt and Or-opt moves of all the cities are evaluated at once with
+# NumPy on the array of the tour order, and the improving ones applied,
+# best first, as long as they still improve the tour.  The path search
+# then starts from a tour without its obvious crossings.
+
+# Cities whose moves are evaluated together, to bound the arrays size.
+block_size = 1 << 15
+
+# Longest segment of cities moved by Or-opt.
+or_opt_length = 3
+
+
+class OrderArrays(object):
+    """ The tour order in NumPy arrays :
+
+          self.order[k]     = city at position k
+          self.pos[city]    = position of city
+
+        A 2-opt exchange reverses the shorter of the two paths between
+        the roads it removes, so the direction of the tour may change ;
+        next and prev are only meaningful until the next exchange.
+        The cities of the roads changed are kept in self.touched.
+    """
+
+    def __init__(self, order):
+        self.order = numpy.array(order, dtype=int)
+        self.n = len(order)
+        self.pos = numpy.empty(self.n, dtype=int)
+        self.pos[self.order] = numpy.arange(self.n)
+        self.touched = []
+
+    def next(self, city):
+        return self.order[(self.pos[city] + 1) % self.n]
+
+    def prev(self, city):
+        return self.order[(self.pos[city] - 1) % self.n]
+
+    def reverse(self, i, j):
+        """ Reverse the cities from position i to position j, going forward
+            (j may be before i), or the other cities if they are fewer. """
+        n = self.n
+        count = (j - i) % n + 1
+        if 2 * count > n:
+            (i, j, count) = ((j + 1) % n, (i - 1) % n, n - count)
+        if i <= j:
+            positions = numpy.arange(i, j + 1)
+        else:
+            positions = numpy.arange(i, i + count) % n
+        cities = self.order[positions][::-1]
+        self.order[positions] = cities
+        self.pos[cities] = positions
+
+    def exchange(self, a, b, c, d):
+        """ Replace the roads (a, b) and (c, d) by (a, c) and (b, d) :
+            b follows a and d follows c in one direction of the tour. """
+        self.touched.extend((a, b, c, d))
+        if self.next(a) == b:
+            self.reverse(self.pos[b], self.pos[c])
+        else:
+            self.reverse(self.pos[a], self.pos[d])
+
+
+class PreOptimizer(object):
+    """ 2-opt and Or-opt moves towards the 'count' first candidates
+        of each city in the Roads.
+
+        2-opt removes the roads from a city a and from one of its
+        candidates c to their next (or previous) cities b and d,
+        and adds (a, c) and (b, d).  Or-opt moves a segment of 1 to
+        or_opt_length cities s ... e between a candidate of s or e
+        and its next or previous city, in either direction.
+
+        As in tour_improve, the moves are only evaluated again around the
+        cities of the roads changed by the previous round (don't-look bits),
+        then for all the cities once they find nothing.
+    """
+
+    def __init__(self, cities, roads, order, count=5):
+        self.cities = cities
+        self.tour = OrderArrays(order)
+        self.candidates = self.candidates_matrix(roads, count)
+
+    @staticmethod
+    def candidates_matrix(roads, count):
+        """ Return the N x count array of the first candidates of each
+            city ; missing ones are the city itself, never a valid move. """
+        (start, others) = roads.arrays()
+        n = len(start) - 1
+        matrix = numpy.repeat(numpy.arange(n)[:, None], count, axis=1)
+        for k in range(count):
+            present = start[:-1] + k < start[1:]
+            matrix[present, k] = others[start[:-1][present] + k]
+        return matrix
+
+    def distance(self, i, j):
+        return self.cities.distances(i, j)
+
+    def two_opt_moves(self, cities):
+        """ Return the improving 2-opt moves (delta, a, c, forward) of the
+            cities, the best one of each city. """
+        (tour, distance) = (self.tour, self.distance)
+        moves = []
+        for first in range(0, len(cities), block_size):
+            a = cities[first:first + block_size]
+            c = self.candidates[a]
+            a = a[:, None]
+            for step in (1, -1):
+                b = tour.order[(tour.pos[a] + step) % tour.n]
+                d = tour.order[(tour.pos[c] + step) % tour.n]
+                removed = distance(a, b) + distance(c, d)
+                delta = distance(a, c) + distance(b, d) - removed
+                delta[(c == a) | (c == b) | (d == a)] = 0
+                moves.append(self.best_moves(delta, removed, a[:, 0], c, step == 1))
+        return moves
+
+    def or_opt_moves(self, cities):
+        """ Return the improving Or-opt moves (delta, s, length, x, forward)
+            of the cities, the best one of each city and length : the
+            segment from s is put between x and its next city. """
+        (tour, distance, n) = (self.tour, self.distance, self.tour.n)
+        moves = []
+        for first in range(0, len(cities), block_size):
+            s = cities[first:first + block_size]
+            p = tour.order[(tour.pos[s] - 1) % n]
+            for length in range(1, min(or_opt_length, n - 4) + 1):
+                e = tour.order[(tour.pos[s] + length - 1) % n]
+                nx = tour.order[(tour.pos[e] + 1) % n]
+                cut = (distance(p, s) + distance(e, nx))[:, None]
+                removed = cut - distance(p, nx)[:, None]
+                ends = ((s, True), (e, False)) if length > 1 else ((s, True),)
+                for (end, is_start) in ends:
+                    c = self.candidates[end]
+                    for after in (True, False):
+                        # The candidate is x, or the next city y of x.
+                        if after:
+                            x = c
+                            y = tour.order[(tour.pos[c] + 1) % n]
+                        else:
+                            y = c
+                            x = tour.order[(tour.pos[c] - 1) % n]
+                        # The road to the candidate is (x, s) or (e, y) forward,
+                        # (x, e) or (s, y) backward.
+                        forward = after == is_start
+                        (near_x, near_y) = (s, e) if forward else (e, s)
+                        delta = (distance(x, near_x[:, None]) + distance(near_y[:, None], y) -
+                                 distance(x, y) - removed)
+                        offset_x = (tour.pos[x] - tour.pos[s][:, None]) % n
+                        offset_y = (tour.pos[y] - tour.pos[s][:, None]) % n
+                        delta[(offset_x <= length) | (offset_x == n - 1) |
+                              (offset_y <= length) | (offset_y == n - 1)] = 0
+                        best = self.best_moves(delta, distance(x, y) + cut, s, x, forward)
+                        moves.append((best[0], best[1], numpy.full(len(best[1]), length), best[2], best[3]))
+        return moves
+
+    @staticmethod
+    def best_moves(delta, removed, cities, others, forward):
+        """ Return the (delta, city, other, forward) arrays of the best
+            move of each city, for the ones improving the tour by more
+            than the rounding errors of the lengths of the roads removed. """
+        k = numpy.argmin(delta, axis=1)
+        rows = numpy.arange(len(cities))
+        best = delta[rows, k]
+        improving = best < -epsilon * numpy.maximum(1.0, removed[rows, k])
+        return (best[improving], cities[improving], others[rows, k][improving],
+                numpy.full(improving.sum(), forward, dtype=bool))
+
+    def apply_two_opt(self, a, c, forward):
+        """ Do the 2-opt move if it still improves the current tour. """
+        (tour, distance) = (self.tour, self.cities.distance)
+        (b, d) = (tour.next(a), tour.next(c)) if forward else (tour.prev(a), tour.prev(c))
+        if c == b or d == a or c == a:
+            return False
+        if not shorter(distance(a, c) + distance(b, d), distance(a, b) + distance(c, d)):
+            return False
+        tour.exchange(a, b, c, d)
+        return True
+
+    def apply_or_opt(self, s, length, x, forward):
+        """ Do the Or-opt move if it still improves the current tour. """
+        (tour, distance, n) = (self.tour, self.cities.distance, self.tour.n)
+        e = tour.order[(tour.pos[s] + length - 1) % n]
+        (p, nx, y) = (tour.prev(s), tour.next(e), tour.next(x))
+        for city in (x, y):
+            offset = (tour.pos[city] - tour.pos[s]) % n
+            if offset <= length or offset == n - 1:
+                return False
+        (near_x, near_y) = (s, e) if forward else (e, s)
+        if not shorter(distance(x, near_x) + distance(near_y, y) + distance(p, nx),
+                       distance(x, y) + distance(p, s) + distance(e, nx)):
+            return False
+        # Three 2-opt exchanges : (p, x) (s, y), then (p, nx) (x, e),
+        # then (x, s) (e, y) to keep the direction of the segment.
+        tour.exchange(p, s, x, y)
+        tour.exchange(p, x, nx, e)
+        if forward:
+            tour.exchange(x, e, s, y)
+        return True
+
+    def run(self, moves=('2-opt', 'or-opt'), max_rounds=100):
+        """ Evaluate and apply the moves until none improves the tour ;
+            return the order of the cities and the count of moves done. """
+        done = 0
+        everything = numpy.arange(self.tour.n)
+        active = everything
+        last = None
+        for round_index in range(max_rounds):
+            if not len(active):
+                # The reversals also made new moves between the cities
+                # inside and outside of them : look at all the cities again.
+                if last is everything:
+                    break
+                active = everything
+            last = active
+            self.tour.touched = []
+            if '2-opt' in moves:
+                done += self.apply_moves(self.two_opt_moves(active), self.apply_two_opt)
+            if 'or-opt' in moves:
+                done += self.apply_moves(self.or_opt_moves(active), self.apply_or_opt)
+            active = self.neighborhood(numpy.unique(numpy.array(self.tour.touched, dtype=int)))
+        return self.tour.order.tolist(), done
+
+    def neighborhood(self, touched):
+        """ Return the touched cities and the ones having one of them
+            as candidate, whose moves may have changed. """
+        marked = numpy.zeros(self.tour.n, dtype=bool)
+        marked[touched] = True
+        marked |= marked[self.candidates].any(axis=1)
+        return numpy.nonzero(marked)[0]
+
+    @staticmethod
+    def apply_moves(moves, apply):
+        """ Try the moves, best first ; return how many were done. """
+        if not moves:
+            return 0
+        columns = [numpy.concatenate(column) for column in zip(*moves)]
+        applied = 0
+        for k in numpy.argsort(columns[0], kind='mergesort'):
+            if apply(*[column[k] for column in columns[1:]]):
+                applied += 1
+        return applied
+
+
+# The pre-optimization stages, for tsp.py --pre-opt.
+pre_optimizers = {
+    '2-opt': ('2-opt',),
+    'or-opt': ('or-opt',),
+    '2-opt+or-opt': ('2-opt', 'or-opt'),
+}
+
+
+def pre_optimize(name, tour, count=5):
+    """ Return a new tour of the cities of tour, improved by the named
+        pre_optimizers stage, and the count of moves done. """
+    optimizer = PreOptimizer(tour.all_cities, tour.roads, tour.city_sequence(), count)
+    (order, done) = optimizer.run(pre_optimizers[name])
+    return tour.new(order), done
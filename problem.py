@@ -0,0 +1,16 @@
+class Problem(object):
+    """ One TSP instance : its Cities, their candidate Roads, the search
+        statistics (a SearchStats, or None when they are not collected)
+        and the TranspositionTable of path_search (or None).
+        The tours made with a Problem use these instead of the Tour class
+        attributes, so that several instances can be solved in one process. """
+
+    def __init__(self, cities, roads, stats=None, transpositions=None):
+        self.cities = cities
+        self.roads = roads
+        self.stats = stats
+        self.transpositions = transpositions
+
+    def tour(self, cities, tour_class):
+        """ Return the tour_class tour going through the cities indices in order. """
+        return tour_class(cities, self)
@@ -1,50 +1,14 @@
-import math
+# A road is the (i, j) tuple of the indices of the two cities it joins,
+# with i < j, so that it is the same key whichever way it is asked for,
+# in the tours and in the sets of roads of the path search.
+# Its length is not stored ; Cities.distance gives it when needed.
 
 
-class Road(list):
+def road(city1, city2):
+    """ Return the road between two cities. """
+    return (city1, city2) if city1 < city2 else (city2, city1)
 
-    def __init__(self, city1, city2):
-        super(Road, self).__init__([city1, city2])
-        self.length = math.sqrt((city1.x - city2.x)**2 + (city1.y - city2.y)**2)
-        self._str = "%s--%s (%4.2f)" % (self[0].name, self[1].name, self.length)
-        self._id = id(self._str)
 
-    def other(self, city):
-        """ Return city at other end of road. """
-        if city not in self:
-            return None
-        else:
-            return self[1] if (self[0] == city) else self[0]
-
-    def __str__(self):
-        return self._str
-
-    def __hash__(self):
-        # Set these be OK as dictionary keys and set elements.
-        # Otherwise, python is unhappy about using 'em that way,
-        # since they inherit from mutable lists.
-        return id(self._id)
-
-    # And since this inherits from list, it already has <, >, etc.
-    # This unfortunately means that just defining __cmp__ won't work,
-    # since the others take precedence.  Python calls these "rich comparisons";
-    # see http://docs.python.org/library/functools.html#functools.total_ordering
-    # and http://docs.python.org/reference/datamodel.html#object.__lt__ .
-
-    def __eq__(self, other):
-        return self._str == str(other)
-
-    # The following comparisons will fail when comparing a Road with non-Road.
-    # So don't do that.
-
-    def __lt__(self, other):
-        return self.length < other.length
-
-    def __le__(self, other):
-        return self.length <= other.length
-
-    def __gt__(self, other):
-        return self.length > other.length
-
-    def __ge__(self, other):
-        return self.length <= other.length
+def other(road, city):
+    """ Return city at other end of road. """
+    return road[1] if road[0] == city else road[0]
@@ -1,26 +1,124 @@
-class Roads(dict):
-    """ A collection of roads with
-          * no duplicates
-          * no city sequence
-          * access by city pairs
-          * access to other city from a given one
-          * modifications via roads.add(road), roads.remove(road)
-          * optional ordering by road length
-        This is designed to be both
-          * a data structure for all the roads in a TSP,
-          * a base class for the Tour object used in the LK algorithm.
+from array import array
+import numpy
+
+
+class Roads(object):
+    """ The candidate roads of the cities : for each city, the cities
+        at the other end of its candidate roads, shortest road first.
+        They are kept in one flat array of city indices :
+
+          self.others[self.start[i]:self.start[i + 1]]  = the candidates of city i
+
+        A road given as candidate for one of its cities is a candidate
+        for both, so that the path search can add it from either end.
+
+        The alpha-nearness candidates (see heldkarp.py) are ordered by alpha
+        instead of length, and come with the Held-Karp lower_bound of the
+        tour lengths.
+    """
+
+    __slots__ = ('start', 'others', 'lower_bound')
+
+    # NumPy type of the array('l') items, for arrays() and from_arrays().
+    dtype = numpy.dtype('i%i' % array('l').itemsize)
+
+    def __init__(self, cities, neighbors):
+        n = len(neighbors)
+        self.lower_bound = None
+        linked = [set(row) for row in neighbors]
+        for (i, row) in enumerate(neighbors):
+            for j in row:
+                linked[j].add(i)
+        self.start = array('l', [0] * (n + 1))
+        self.others = array('l')
+        for i in range(n):
+            # Equal lengths are ordered by index, for the same order in every process.
+            self.others.extend(sorted(linked[i], key=lambda j: (cities.distance(i, j), j)))
+            self.start[i + 1] = len(self.others)
+
+    @classmethod
+    def from_arrays(cls, start, others):
+        """ Return the Roads of the given start and others arrays
+            (as given by arrays()), copied in one go. """
+        roads = cls.__new__(cls)
+        roads.lower_bound = None
+        roads.start = array('l')
+        roads.start.fromstring(numpy.ascontiguousarray(start, dtype=cls.dtype).tostring())
+        roads.others = array('l')
+        roads.others.fromstring(numpy.ascontiguousarray(others, dtype=cls.dtype).tostring())
+        return roads
+
+    def arrays(self):
+        """ Return the NumPy arrays of start and others (not copied). """
+        return numpy.frombuffer(self.start, dtype=self.dtype), numpy.frombuffer(self.others, dtype=self.dtype)
+
+    def __len__(self):
+        """ Number of candidate roads. """
+        return len(self.others) // 2
+
+    def get_by_length(self, city, count=None):
+        """ Return the count (or all) nearest candidates of city. """
+        (start, end) = (self.start[city], self.start[city + 1])
+        if count is not None and start + count < end:
+            end = start + count
+        return self.others[start:end]
+
+    def pairs(self):
+        """ Iterate over the candidate roads as (i, j) with i < j. """
+        (start, others) = (self.start, self.others)
+        for i in range(len(start) - 1):
+            for k in range(start[i], start[i + 1]):
+                if i < others[k]:
+                    yield (i, others[k])
+
+
+class DynamicRoads(Roads):
+    """ Roads whose candidates can be changed city by city, for cities added
+        to (or removed from) an instance already solved : the candidates set
+        with set_candidates are kept in self.changed, by city, and replace
+        the ones of the flat arrays (which the new cities are not in).
     """
-    def __init__(self, roads=None):
-        if not roads:
-            roads = {}
-        super(Roads, self).__init__(roads)
-        self.by_length = None
-
-    def get(self, city1, city2):
-        return super(Roads, self).get((city1, city2), super(Roads, self).get((city2, city1), None))
-
-    def get_by_length(self, count=None):
-        if not self.by_length:
-            self.by_length = self.values()
-            self.by_length.sort()
-        return self.by_length[:count]
+
+    __slots__ = ('changed',)
+
+    @classmethod
+    def from_roads(cls, roads):
+        """ Return DynamicRoads sharing the arrays of roads. """
+        dynamic = cls.__new__(cls)
+        (dynamic.start, dynamic.others, dynamic.lower_bound) = (roads.start, roads.others, roads.lower_bound)
+        dynamic.changed = {}
+        return dynamic
+
+    def set_candidates(self, city, others):
+        self.changed[city] = array('l', others)
+
+    def size(self):
+        """ Number of cities, counting the new ones. """
+        return max(len(self.start) - 1, max(self.changed) + 1 if self.changed else 0)
+
+    def arrays(self):
+        """ Return new NumPy arrays of start and others, with the changes. """
+        if not self.changed:
+            return Roads.arrays(self)
+        rows = [self.get_by_length(i) for i in range(self.size())]
+        start = numpy.zeros(len(rows) + 1, dtype=self.dtype)
+        start[1:] = numpy.cumsum([len(row) for row in rows])
+        others = numpy.array([j for row in rows for j in row], dtype=self.dtype)
+        return start, others
+
+    def __len__(self):
+        return sum(len(self.get_by_length(i)) for i in range(self.size())) // 2
+
+    def get_by_length(self, city, count=None):
+        others = self.changed.get(city)
+        if others is None:
+            if city >= len(self.start) - 1:
+                return array('l')
+            return Roads.get_by_length(self, city, count)
+        return others if count is None else others[:count]
+
+    def pairs(self):
+        for i in range(self.size()):
+            for j in self.get_by_length(i):
+                if i < j:
+                    yield (i, j)
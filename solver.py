@@ -0,0 +1,274 @@
+import os
+import json
+import inspect
+import time
+import random
+import multiprocessing
+import numpy
+from cities import Cities, metrics
+from loader import load
+from problem import Problem
+from tour import Tour
+from arraytour import ArrayTour
+from heldkarp import ascent_iterations
+from lk import tour_improve, IterativeSearch
+from ils import IteratedLK
+from parallel import TourPool
+from construction import build_tour
+from preopt import pre_optimize
+from partition import tiled_tour, stages_report
+from stats import SearchStats, time_methods, untime_methods, profiled, Sampler
+from transposition import TranspositionTable
+
+# The library entry points : solve() one instance, with all its state in
+# a Problem instead of the Tour class attributes, and solve_batch() many
+# instances on a pool of processes.
+
+tour_classes = {'linked': Tour, 'array': ArrayTour}
+
+# The instance files read from a directory by solve_batch.
+instance_extensions = ('.csv', '.tsp')
+
+
+def make_cities(coords, names=None, metric='EXACT_2D'):
+    """ Return the Cities of a sequence (or N x 2 array) of (x, y) coordinates,
+        named by their index if names are not given.  Cities are returned as is. """
+    if isinstance(coords, Cities):
+        return coords
+    points = numpy.asarray(coords, dtype=float)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("Expected a sequence of (x, y) coordinates.")
+    if metric not in metrics:
+        raise ValueError("Unknown metric %s, expected one of %s." % (metric, ", ".join(sorted(metrics))))
+    if names is None:
+        names = [str(i) for i in range(len(points))]
+    elif len(names) != len(points):
+        raise ValueError("There are %i names for %i cities." % (len(names), len(points)))
+    return metrics[metric](names, points[:, 0], points[:, 1])
+
+
+def solve(coords, names=None, metric='EXACT_2D', neighbors=3, candidates=10, candidate_type='nearest',
+          ascent_iterations=ascent_iterations, candidate_cache=None, init='random', pre_opt=None,
+          backend='array', depth=None, time_limit=None, max_trials=None, seed=None, workers=None, stats=False,
+          tile_size=None, transpositions=0, search='recursive', breadth=None, first_improvement=False,
+          order=None, start_cities=None, trials=0, best_trial=0, observer=None, progress=None,
+          verbose=False, profile=None, quiet=True, interruptible=False):
+    """ Solve the TSP of the cities at coords (or of a Cities object), with
+        the same options as tsp.py, and return a dict of :
+
+          order            the cities indices along the tour
+          length           the tour length
+          initial_length   the length of the tour built by init
+          lower_bound      the Held-Karp bound of the alpha candidates, or None
+          times            seconds spent in each stage ; by tiles, 'tiles' is
+                           the time up to the join and 'lk' the repair
+          stats            the search statistics, if stats is set
+          stages           the (stage, seconds, length, note) of tiled_tour,
+                           if the cities were solved by tiles (tile_size set)
+          transpositions   the counts of the recursive search transposition table
+                           of at most transpositions states, if set
+          interrupted      True if the iterated LK was stopped by Ctrl-C
+
+        The initial tour is built by init, random by default as in tsp.py ;
+        greedy is much faster on large instances.
+        time_limit is the time of the LK pass and of the iterated LK together ;
+        it doesn't count the time spent before resuming.
+        With workers, the LK path searches are run in rounds by a TourPool of
+        that many processes (see parallel.py), else one at a time by tour_improve.
+        With search 'iterative', the path searches are done by an IterativeSearch
+        of the breadth and first_improvement options.
+        Nothing is printed, and nothing is kept from one call to the next
+        (except the random generator, seeded if seed is given).
+
+        tsp.py also uses these :
+
+          order            the cities of the first tour, instead of building one
+          start_cities     the cities the LK pass starts from (see tour_improve),
+                           [] to go on with the iterated LK right away
+          trials           the iterated LK trials already done, when resumed,
+          best_trial       and the one which found the best tour
+          observer         observer(tour, iteration, iterations, best_iteration)
+                           of the LK pass and of the trials (counted from trials)
+          progress         progress(stage) at the start of each stage, named as
+                           in times ('candidates', 'init', 'lk', 'ils' ...)
+          verbose          print the details of the path searches
+          profile          'cprofile' or 'sampling' to profile the LK pass
+          quiet            False to print the progress of each stage
+          interruptible    Ctrl-C stops the iterated LK, keeping the best tour """
+    def say(line):
+        if not quiet:
+            print line
+
+    def begin(stage):
+        if progress:
+            progress(stage)
+        return time.time()
+    times = {}
+    start = begin('candidates')
+    cities = make_cities(coords, names, metric)
+    n = len(cities)
+    if n < 5:
+        order = range(n)
+        length = sum(cities.distance(order[i - 1], order[i]) for i in range(n)) if n > 1 else 0.0
+        return {'order': order, 'length': length, 'initial_length': length, 'lower_bound': None, 'times': times}
+    if search not in ('recursive', 'iterative'):
+        raise ValueError("Unknown search %s, expected recursive or iterative." % search)
+    if search == 'iterative' and transpositions:
+        raise ValueError("The transposition table only applies to the recursive search.")
+    if seed is not None:
+        random.seed(seed)
+    tour_class = tour_classes[backend]
+    search_stats = SearchStats() if stats else None
+    wrapped = time_methods(tour_class) if stats else []
+    try:
+        roads = Tour.candidate_roads(cities, max(candidates, neighbors), candidate_cache, candidate_type,
+                                     ascent_iterations)
+        times['candidates'] = time.time() - start
+        say("Candidate roads : %i, found in %f seconds." % (len(roads), times['candidates']))
+        if roads.lower_bound is not None:
+            say("Held-Karp lower bound : %f" % roads.lower_bound)
+        search = IterativeSearch(breadth, first_improvement) if search == 'iterative' else None
+        table = TranspositionTable(transpositions) if transpositions else None
+        problem = Problem(cities, roads, search_stats, table)
+        stages = None
+        if order is not None:
+            tour = tour_class(order, problem)
+            initial_length = tour.tour_length()
+        elif tile_size and n > tile_size:
+            start = begin('tiles')
+            (tour, stages) = tiled_tour(problem, tour_class, tile_size, neighbors, init, pre_opt, depth, workers,
+                                        search)
+            # The first length of the tiled tour is the one of the joined tiles tours.
+            initial_length = stages[2][2]
+            # The LK repair along the seams is the LK pass of the tiled tour.
+            times['lk'] = stages[-1][1]
+            times['tiles'] = time.time() - start - times['lk']
+            say("Tiled %s tour :" % init)
+            for line in stages_report(stages):
+                say(line)
+        else:
+            start = begin('init')
+            tour = build_tour(init, cities, tour_class, problem)
+            initial_length = tour.tour_length()
+            times['init'] = time.time() - start
+            say("Initial %s tour length : %f" % (init, initial_length))
+            if pre_opt:
+                start = begin('pre_opt')
+                (tour, moves) = pre_optimize(pre_opt, tour)
+                times['pre_opt'] = time.time() - start
+                say("%s pre-optimization : %i moves in %f seconds, tour length : %f" %
+                    (pre_opt, moves, times['pre_opt'], tour.tour_length()))
+        # No LK pass after the repair of the tiles, or when resuming the iterated LK.
+        lk_pass = not stages and start_cities != []
+        if lk_pass:
+            start = begin('lk')
+        pool = TourPool(cities, tour_class, workers, problem) if workers and lk_pass else None
+        try:
+            improve = pool.tour_improve if pool else tour_improve
+            if profile == 'cprofile':
+                improve = profiled(improve)
+            elif profile == 'sampling':
+                improve = Sampler()(improve)
+            if lk_pass:
+                tour = improve(tour, neighbors, verbose, depth, observer, start_cities, quiet, search=search)[0]
+                times['lk'] = time.time() - start
+            interrupted = False
+            if time_limit is not None or max_trials is not None:
+                remaining = None if time_limit is None else max(0, time_limit - times.get('lk', 0))
+                start = begin('ils')
+                ils = IteratedLK(tour, neighbors, depth, search=search)
+                (ils.trials, ils.best_trial) = (trials, best_trial)
+
+                def observe(best, trial, trials_count, best_trial):
+                    # The trials count those before resuming.
+                    observer(best, ils.trials, trials_count, best_trial)
+                try:
+                    ils.run(remaining, None if max_trials is None else max(0, max_trials - trials),
+                            observe if observer else None, quiet)
+                except KeyboardInterrupt:
+                    if not interruptible:
+                        raise
+                    interrupted = True
+                    say("Interrupted, keeping the best tour so far.")
+                tour = ils.best
+                times['ils'] = time.time() - start
+                say(ils.report())
+        finally:
+            if pool:
+                pool.close()
+    finally:
+        untime_methods(wrapped)
+    result = {'order': list(tour.city_sequence()), 'length': tour.tour_length(), 'initial_length': initial_length,
+              'lower_bound': roads.lower_bound, 'times': times}
+    if search_stats:
+        result['stats'] = search_stats.as_dict()
+    if stages:
+        result['stages'] = stages
+    if table:
+        result['transpositions'] = table.counts()
+    if interrupted:
+        result['interrupted'] = True
+    return result
+
+
+# The default options of solve(), also those of tsp.py and batch.py.
+(_names, _args, _keywords, _defaults) = inspect.getargspec(solve)
+solve_defaults = dict(zip(_names[-len(_defaults):], _defaults))
+
+
+def instance_tasks(source, options):
+    """ Yield the (id, instance, options) of the instances of source :
+        the csv and TSPLIB files of a directory (the instance is the file
+        name), or the lines of a JSONL file, each one a JSON object with
+        'coords' and optionally 'id', 'names', 'metric' and 'options'
+        (overriding the given options for this instance). """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(instance_extensions):
+                yield name, os.path.join(source, name), options
+        return
+    with open(source) as lines:
+        for (number, line) in enumerate(lines):
+            if not line.strip():
+                continue
+            instance = json.loads(line)
+            instance_options = dict(options)
+            instance_options.update(instance.pop('options', {}))
+            yield instance.get('id', number), instance, instance_options
+
+
+def _solve_task(task):
+    """ Solve one instance of instance_tasks in a batch worker ;
+        an error is returned instead of stopping the batch. """
+    (name, instance, options) = task
+    begin = time.time()
+    try:
+        if isinstance(instance, dict):
+            cities = make_cities(instance['coords'], instance.get('names'), instance.get('metric', 'EXACT_2D'))
+        else:
+            cities = load(instance)
+        result = solve(cities, **options)
+    except Exception as error:
+        return {'id': name, 'error': "%s: %s" % (error.__class__.__name__, error)}
+    result['id'] = name
+    result['cities'] = len(cities)
+    result['time'] = time.time() - begin
+    return result
+
+
+def solve_batch(source, processes=None, **options):
+    """ Solve the instances of source (see instance_tasks) with the solve()
+        options, on a pool of processes (one per CPU by default), and yield
+        the result of each instance with its 'id' as soon as it is done.
+        Each instance is solved by one process : the workers option of
+        solve() is not available. """
+    if options.get('workers') is not None:
+        raise ValueError("The batch instances are solved by one process each, workers can't be set.")
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_solve_task, instance_tasks(source, options)):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,188 @@
+import json
+import time
+import signal
+import cProfile
+import pstats
+from tour import Tour
+
+# Statistics of the LK search, collected only when enabled :
+# the hot paths look at the stats of the tour (Tour.stats, or those of
+# its Problem), None by default, and the timers are wrappers put around
+# the tour methods by time_methods().
+
+timed_methods = ('modify', 'unmodify', 'flip_direction')
+
+# The find_lk_mods rules which discard a candidate road, see Tour.find_lk_mods.
+prune_rules = ('previous city', 'no gain', 'deleted road added back', 'added road deleted back')
+
+
+class SearchStats(object):
+    """ Counters and timers of the LK search :
+
+          self.nodes[depth]    = path_search calls at this depth
+          self.candidates      = candidate roads looked at by find_lk_mods
+          self.mods            = modifications returned by find_lk_mods
+          self.pruned[rule]    = candidate roads discarded by each rule
+          self.calls[method]   = calls of the timed tour methods
+          self.times[method]   = seconds spent in them (flip_direction
+                                 is also counted in modify and unmodify)
+          self.passes          = one [searches, improvements, gain, seconds]
+                                 for each tour_improve call
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.candidates = 0
+        self.mods = 0
+        self.pruned = dict.fromkeys(prune_rules, 0)
+        self.calls = dict.fromkeys(timed_methods, 0)
+        self.times = dict.fromkeys(timed_methods, 0.0)
+        self.passes = []
+
+    def count_node(self, depth):
+        if depth >= len(self.nodes):
+            self.nodes.extend([0] * (depth + 1 - len(self.nodes)))
+        self.nodes[depth] += 1
+
+    def count_mods(self, candidates, mods, pruned):
+        """ Count the candidates and mods of one find_lk_mods call,
+            pruned being the counts of prune_rules. """
+        self.candidates += candidates
+        self.mods += mods
+        for (rule, count) in zip(prune_rules, pruned):
+            self.pruned[rule] += count
+
+    def add_pass(self, searches, improvements, gain, seconds):
+        self.passes.append([searches, improvements, gain, seconds])
+
+    def as_dict(self):
+        return {'nodes': self.nodes, 'candidates': self.candidates, 'mods': self.mods,
+                'pruned': self.pruned, 'calls': self.calls, 'times': self.times, 'passes': self.passes}
+
+    def merge(self, counts):
+        """ Add the counts of as_dict() from another process. """
+        nodes = counts['nodes']
+        if len(nodes) > len(self.nodes):
+            self.nodes.extend([0] * (len(nodes) - len(self.nodes)))
+        for (depth, count) in enumerate(nodes):
+            self.nodes[depth] += count
+        self.candidates += counts['candidates']
+        self.mods += counts['mods']
+        for rule in prune_rules:
+            self.pruned[rule] += counts['pruned'][rule]
+        for method in timed_methods:
+            self.calls[method] += counts['calls'][method]
+            self.times[method] += counts['times'][method]
+        self.passes.extend(counts['passes'])
+
+    def dump(self, filename):
+        with open(filename, 'w') as output:
+            json.dump(self.as_dict(), output, indent=1, sort_keys=True)
+
+    def summary(self):
+        lines = ["===== search statistics",
+                 "path_search nodes per depth : " + " ".join("%i:%i" % (d, n) for (d, n) in enumerate(self.nodes)),
+                 "find_lk_mods : %i candidate roads, %i mods ; pruned : %s" %
+                 (self.candidates, self.mods, ", ".join("%s %i" % (rule, self.pruned[rule]) for rule in prune_rules)),
+                 " ; ".join("%s : %i calls, %.3f s" % (m, self.calls[m], self.times[m]) for m in timed_methods)]
+        if self.passes:
+            (searches, improvements, gain, seconds) = [sum(column) for column in zip(*self.passes)]
+            lines.append("%i tour_improve passes : %i path searches, %i improvements, gain %f in %.2f s" %
+                         (len(self.passes), searches, improvements, gain, seconds))
+            for (k, (searches, improvements, gain, seconds)) in enumerate(self.passes[:5]):
+                lines.append("  pass %i : %i path searches, %i improvements, gain %f in %.2f s" %
+                             (k + 1, searches, improvements, gain, seconds))
+        return "\n".join(lines)
+
+
+def timed(name, method):
+    """ Return the method, adding its calls and time to the tour stats. """
+    def timed_method(self, *args):
+        stats = self.stats
+        if stats is None:
+            return method(self, *args)
+        start = time.time()
+        result = method(self, *args)
+        stats.times[name] += time.time() - start
+        stats.calls[name] += 1
+        return result
+    timed_method.original = method
+    return timed_method
+
+
+def enable(*tour_classes):
+    """ Start collecting the statistics in a new Tour.stats, timing
+        the methods of Tour and of the given subclasses ; return it. """
+    Tour.stats = SearchStats()
+    time_methods(*tour_classes)
+    return Tour.stats
+
+
+def time_methods(*tour_classes):
+    """ Time the methods of Tour and of the given subclasses, for the
+        tours having stats.  Return the (class, name) of the methods
+        wrapped by this call, for untime_methods. """
+    wrapped = []
+    for cls in (Tour,) + tour_classes:
+        for name in timed_methods:
+            method = cls.__dict__.get(name)
+            if method is not None and not hasattr(method, 'original'):
+                setattr(cls, name, timed(name, method))
+                wrapped.append((cls, name))
+    return wrapped
+
+
+def untime_methods(wrapped):
+    """ Put back the methods wrapped by a time_methods call. """
+    for (cls, name) in wrapped:
+        setattr(cls, name, cls.__dict__[name].original)
+
+
+def profiled(function, filename='tsp.prof', top=20):
+    """ Return the function running under cProfile : its statistics
+        are written to filename and the top functions printed. """
+    def profiled_function(*args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(filename)
+            pstats.Stats(profile).sort_stats('cumulative').print_stats(top)
+            print "Profile written to %s" % filename
+    return profiled_function
+
+
+class Sampler(object):
+    """ Sampling profiler : every 'interval' seconds of CPU time, count the
+        function running and its caller.  Much cheaper than cProfile,
+        it doesn't change the relative cost of the small hot functions. """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = {}
+        self.total = 0
+
+    def sample(self, signum, frame):
+        self.total += 1
+        caller = frame.f_back
+        key = (frame.f_code.co_name, caller.f_code.co_name if caller else '')
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def __call__(self, function, top=20):
+        """ Return the function running under the sampler, printing its report. """
+        def sampled_function(*args, **kwargs):
+            previous = signal.signal(signal.SIGPROF, self.sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+                signal.signal(signal.SIGPROF, previous)
+                print self.report(top)
+        return sampled_function
+
+    def report(self, top=20):
+        lines = ["===== %i samples, every %g s of CPU time" % (self.total, self.interval)]
+        for ((name, caller), count) in sorted(self.samples.items(), key=lambda item: -item[1])[:top]:
+            lines.append("%6.2f%%  %s  (from %s)" % (100.0 * count / max(1, self.total), name, caller))
+        return "\n".join(lines)
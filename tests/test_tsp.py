@@ -0,0 +1,288 @@
+""" Tests of the solver, the tour backends, the path searches, the
+    pre-optimizer and the files written by the caches and checkpoints.
+
+    py2 -m unittest discover tests
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cities import Cities
+from tour import Tour
+from arraytour import ArrayTour
+from problem import Problem
+from lk import recursive_search, IterativeSearch
+from preopt import PreOptimizer
+from parallel import TourPool
+from candidatecache import CandidateCache
+from checkpoint import Checkpoint, load_checkpoint
+from solver import solve, solve_batch
+
+
+def random_coords(n, seed, side=1000):
+    rng = random.Random(seed)
+    return [(rng.randint(0, side), rng.randint(0, side)) for i in range(n)]
+
+
+def random_problem(n, seed, candidates=6):
+    (x, y) = zip(*random_coords(n, seed))
+    cities = Cities([str(i) for i in range(n)], x, y)
+    return Problem(cities, Tour.candidate_roads(cities, candidates))
+
+
+def order_length(cities, order):
+    return sum(cities.distance(order[i - 1], order[i]) for i in range(len(order)))
+
+
+class SolveTest(unittest.TestCase):
+
+    options = dict(init='greedy', depth=4, seed=1)
+
+    def check_result(self, coords, result):
+        self.assertEqual(sorted(result['order']), range(len(coords)))
+        cities = Cities([str(i) for i in range(len(coords))], *zip(*coords))
+        self.assertAlmostEqual(result['length'], order_length(cities, result['order']), places=6)
+        self.assertLessEqual(result['length'], result['initial_length'] + 1e-9)
+
+    def test_solve(self):
+        coords = random_coords(60, 1)
+        result = solve(coords, **self.options)
+        self.check_result(coords, result)
+        self.assertEqual(solve(coords, **self.options)['order'], result['order'])
+
+    def test_solve_kicks(self):
+        coords = random_coords(60, 2)
+        result = solve(coords, max_trials=20, **self.options)
+        self.check_result(coords, result)
+        self.assertLessEqual(result['length'], solve(coords, **self.options)['length'] + 1e-9)
+
+    def test_solve_batch(self):
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'instances.jsonl')
+            instances = {'a': random_coords(40, 3), 'b': random_coords(50, 4)}
+            with open(source, 'w') as lines:
+                for (name, coords) in sorted(instances.items()):
+                    lines.write(json.dumps({'id': name, 'coords': coords}) + '\n')
+                lines.write(json.dumps({'id': 'bad', 'coords': [[0, 0], [1]]}) + '\n')
+            results = dict((result['id'], result) for result in solve_batch(source, 1, **self.options))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(results), ['a', 'b', 'bad'])
+        self.assertIn('error', results['bad'])
+        for (name, coords) in instances.items():
+            self.check_result(coords, results[name])
+            self.assertEqual(results[name]['order'], solve(coords, **self.options)['order'])
+
+
+class TwoLevelListTest(unittest.TestCase):
+    """ The ArrayTour (two-level list) against the linked Tour, on random changes. """
+
+    def check_same(self, linked, array, rng):
+        n = len(linked.neighbors)
+        cities = [city for city in range(n) if linked.neighbors[city] is not None]
+        start = cities[0]
+        self.assertEqual(array.cities_from(start), linked.cities_from(start))
+        for city in rng.sample(cities, min(10, len(cities))):
+            self.assertEqual(array.next_city(city), linked.next_city(city))
+            self.assertEqual(array.prev_city(city), linked.prev_city(city))
+        for k in range(10):
+            (a, b, c) = rng.sample(cities, 3)
+            self.assertEqual(array.between(a, b, c), linked.between(a, b, c))
+        self.assertAlmostEqual(array.tour_length(), linked.tour_length(), places=6)
+
+    def test_random_changes(self):
+        rng = random.Random(5)
+        n = 200
+        problem = random_problem(n, 5)
+        order = range(n - 10)
+        rng.shuffle(order)
+        (linked, array) = (Tour(order, problem), ArrayTour(order, problem))
+        outside = range(n - 10, n)
+        for step in range(300):
+            cities = linked.cities_from(linked.city_sequence()[0])
+            choice = rng.random()
+            if choice < 0.4:
+                # A path short of the whole tour, which has no end roads.
+                (a, b) = (rng.choice(cities), rng.choice(cities))
+                if linked.next_city(b) == a:
+                    b = a
+                for tour in (linked, array):
+                    tour.reverse_path(a, b)
+            elif choice < 0.6 and outside:
+                city = outside.pop()
+                a = rng.choice(cities)
+                b = linked.next_city(a)
+                for tour in (linked, array):
+                    tour.insert_city(city, a, b)
+            elif choice < 0.65 and len(cities) > 10:
+                city = rng.choice(cities)
+                for tour in (linked, array):
+                    tour.remove_city(city)
+                outside.append(city)
+            elif len(cities) == n:
+                # An LK path modification, closed into a new tour ; the
+                # candidate roads may lead to removed cities otherwise.
+                city = rng.choice(cities)
+                start = (linked.get_road(city, linked.next_city(city)), rng.random() < 0.5)
+                for tour in (linked, array):
+                    tour.tour2path(*start)
+                mods = linked.find_lk_mods(5)
+                if mods:
+                    mod = rng.choice(mods)
+                    for tour in (linked, array):
+                        tour.modify(*mod)
+                        tour.close()
+                else:
+                    for tour in (linked, array):
+                        tour.path2tour()
+            self.check_same(linked, array, rng)
+
+
+class PreOptimizerTest(unittest.TestCase):
+
+    def test_moves(self):
+        problem = random_problem(300, 6)
+        cities = problem.cities
+        order = range(300)
+        random.Random(6).shuffle(order)
+        optimizer = PreOptimizer(cities, problem.roads, order)
+        applied = []
+
+        def checked(apply):
+            def check(*move):
+                before = order_length(cities, optimizer.tour.order.tolist())
+                done = apply(*move)
+                after = optimizer.tour.order.tolist()
+                self.assertEqual(sorted(after), range(300))
+                self.assertEqual(list(optimizer.tour.pos[after]), range(300))
+                if done:
+                    applied.append(move)
+                    self.assertLess(order_length(cities, after), before)
+                else:
+                    self.assertAlmostEqual(order_length(cities, after), before, places=6)
+                return done
+            return check
+        optimizer.apply_two_opt = checked(optimizer.apply_two_opt)
+        optimizer.apply_or_opt = checked(optimizer.apply_or_opt)
+        (new_order, done) = optimizer.run()
+        self.assertEqual(done, len(applied))
+        self.assertGreater(done, 0)
+        self.assertLess(order_length(cities, new_order), order_length(cities, order))
+
+
+class SearchTest(unittest.TestCase):
+
+    def test_iterative_matches_recursive(self):
+        problem = random_problem(80, 7)
+        search = IterativeSearch()
+        for seed in range(4):
+            order = range(80)
+            random.Random(seed).shuffle(order)
+            tour = ArrayTour(order, problem)
+            for city in order[:10]:
+                for backward in (False, True):
+                    tour.tour2path(tour.get_road(city, tour.next_city(city)), backward)
+                    (length, mods) = recursive_search(tour, 5, False, 3)
+                    (iterative_length, iterative_mods) = search(tour, 5, False, 3)
+                    self.assertEqual(iterative_mods, mods)
+                    self.assertAlmostEqual(iterative_length, length, places=6)
+                    tour.path2tour()
+
+    def test_pool_tour_independent_of_workers(self):
+        problem = random_problem(150, 8)
+        order = range(150)
+        random.Random(8).shuffle(order)
+        orders = []
+        for workers in (1, 2):
+            pool = TourPool(problem.cities, ArrayTour, workers, problem)
+            try:
+                tour = pool.tour_improve(ArrayTour(order, problem), 5, False, 4, quiet=True)[0]
+            finally:
+                pool.close()
+            orders.append(tour.city_sequence())
+        self.assertEqual(orders[0], orders[1])
+
+
+class CandidateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = CandidateCache(self.directory)
+        self.problem = random_problem(50, 9)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        self.cache.put(self.problem.cities, 6, self.problem.roads)
+        roads = self.cache.get(self.problem.cities, 6)
+        for (got, expected) in zip(roads.arrays(), self.problem.roads.arrays()):
+            self.assertEqual(list(got), list(expected))
+        self.assertIsNone(self.cache.get(self.problem.cities, 5))
+
+    def corrupt(self, suffix, change):
+        self.cache.put(self.problem.cities, 6, self.problem.roads)
+        files = self.cache.paths(self.cache.key(self.problem.cities, 6))
+        name = [name for name in files if name.endswith(suffix)][0]
+        with open(name, 'rb') as data:
+            content = data.read()
+        with open(name, 'wb') as data:
+            data.write(change(content))
+        self.assertIsNone(self.cache.get(self.problem.cities, 6))
+        for name in files:
+            self.assertFalse(os.path.exists(name))
+
+    def test_changed_data(self):
+        self.corrupt('.npy', lambda content: content[:-8] + '\x01' * 8)
+
+    def test_truncated_data(self):
+        self.corrupt('.npy', lambda content: content[:len(content) // 2])
+
+    def test_truncated_info(self):
+        self.corrupt('.json', lambda content: content[:-5])
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'run.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        rng = random.Random(10)
+        rng.gauss(0, 1)
+        checkpoint = Checkpoint(self.filename, rng=rng)
+        checkpoint.stage = 'ils'
+        order = range(20)
+        rng.shuffle(order)
+        checkpoint.save(order, 123.5, 42, 17)
+        expected = [rng.random() for i in range(5)] + [rng.gauss(0, 1)]
+        state = load_checkpoint(self.filename)
+        self.assertEqual((state['order'], state['length'], state['stage'], state['iteration'],
+                          state['best_iteration']), (order, 123.5, 'ils', 42, 17))
+        restored = random.Random()
+        restored.setstate(state['rng_state'])
+        self.assertEqual([restored.random() for i in range(5)] + [restored.gauss(0, 1)], expected)
+        self.assertFalse(os.path.exists(self.filename + '.tmp'))
+
+    def test_truncated(self):
+        Checkpoint(self.filename).save(range(20), 1.0, 0, 0)
+        with open(self.filename, 'rb') as data:
+            content = data.read()
+        with open(self.filename, 'wb') as data:
+            data.write(content[:-10])
+        self.assertRaises(ValueError, load_checkpoint, self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,19 @@
-import warnings
 from roads import Roads
-from road import Road
-from matplotlib import pyplot as plt
+from road import road, other
+from candidates import nearest_neighbors
+from heldkarp import alpha_roads, ascent_iterations
 
 
 class Tour(set):
 
-    roads = Roads()
+    # The cities, their candidate roads and the search statistics of the
+    # tours made without a Problem (see problem.py), set by init_roads ;
+    # the tours of a Problem have their own, so that several instances
+    # can be solved in the same process.
+    all_cities = None
+    roads = None
+    stats = None  # SearchStats, when enabled in stats.py
+    transpositions = None  # TranspositionTable of path_search, when enabled
 
     # This is the heart of the data structure for the Lin-Kernighan algorithm.
     #
@@ -34,9 +41,9 @@ class Tour(set):
     #                            |                               |
     #   1 =>  2  => ... (i-1) => i     N   <= (N-1) ... (i+2) <= (i+1)
     #
-    # In this implementation they don't actually have numbers;
-    # instead the ordering is contained in a doubly linked list
-    # using a dictionary.
+    # In this implementation they don't actually have these numbers;
+    # a city is its index in self.all_cities, and the ordering
+    # is contained in a doubly linked list, indexed by city.
     #
     #   self.first = city 1
     #   self.last = city N
@@ -45,8 +52,9 @@ class Tour(set):
     # So to do one of these LK modifications, self.last is changed
     # and self.neighbors is modified from city i onwards.
     #
-    # The Road objects don't store a direction; they just contain
-    # distances, and allow for sorting by length in their Roads container.
+    # The roads are (i, j) pairs of cities which don't store a direction;
+    # their lengths are computed when needed, and the candidate roads
+    # are sorted by length in self.roads.
     #
     # The rest of the L.K. algorithm is just keeping track
     # of which cities/roads are good candidates for this
@@ -55,43 +63,100 @@ class Tour(set):
     # within the M'th shortest (e.g. the shortest 5) from a city.
 
     @staticmethod
-    def init_roads(cities):
+    def init_roads(cities, candidates=None, cache=None, kind='nearest', iterations=ascent_iterations):
         """
-        construct all possible roads from cities list.
-        The loop is like constructing a strictly upper matrix.
+        construct the candidate roads of the Cities (see candidate_roads),
+        kept with Cities in Tour.all_cities and Tour.roads.
         """
-        for index1, city1 in enumerate(cities):
-            for index2, city2 in enumerate(cities[index1+1:]):
-                road = Road(city1, city2)
-                for obj in (Tour, city1, city2):
-                    obj.roads[(city1, city2)] = road
+        Tour.all_cities = cities
+        Tour.roads = Tour.candidate_roads(cities, candidates, cache, kind, iterations)
+
+    @staticmethod
+    def candidate_roads(cities, candidates=None, cache=None, kind='nearest', iterations=ascent_iterations):
+        """
+        Return the candidate roads of the Cities : the roads from each city
+        to its 'candidates' nearest neighbors (all the other cities if not given),
+        found with a KD-tree instead of building all the N*N roads.
+        With kind 'alpha', they are the alpha-nearest neighbors instead,
+        after 'iterations' steps of the Held-Karp ascent (see heldkarp.py).
+        If a CandidateCache is given, they are read from it when it has them
+        and saved into it when they are computed.
+        """
+        if kind == 'alpha':
+            kind = 'alpha %i' % iterations
+        roads = cache.get(cities, candidates, kind) if cache else None
+        if roads is None:
+            if kind == 'nearest':
+                roads = Roads(cities, nearest_neighbors(cities.points(), candidates))
+            else:
+                roads = alpha_roads(cities, candidates or len(cities), iterations)
+            if cache:
+                cache.put(cities, candidates, roads, kind)
+        return roads
+
+    @staticmethod
+    def init_candidate_roads(cities, neighbors):
+        """
+        construct the roads from each city i to the cities in neighbors[i],
+        kept with Cities in Tour.all_cities and Tour.roads.
+        """
+        Tour.all_cities = cities
+        Tour.roads = Roads(cities, neighbors)
 
     @staticmethod
     def get_road(city1, city2):
-        return Tour.roads.get(city1, city2)
+        """ Return the road between two cities. """
+        return road(city1, city2)
 
-    def __init__(self, cities):
+    def road_length(self, road):
+        return self.all_cities.distance(road[0], road[1])
 
+    def __init__(self, cities, problem=None):
+        """ Build the tour going through the cities indices in order,
+            with the cities and roads of the Problem if given. """
+        self.problem = problem
+        if problem is not None:
+            self.all_cities = problem.cities
+            self.roads = problem.roads
+            self.stats = problem.stats
+            self.transpositions = problem.transpositions
         self.cities = cities
         n = len(cities)
-        roads = [Tour.get_road(self.cities[i], self.cities[(i + 1) % n]) for i in range(n)]
+        roads = [road(self.cities[i], self.cities[(i + 1) % n]) for i in range(n)]
         super(Tour, self).__init__(roads)
         self.first = self.last = None
-        self.neighbors = {}
+        self.start = None  # (road, backward) given to tour2path
+        self.ordered = True  # False when self.cities is no longer the tour order
+        self.journal = None  # list of the changes closed by apply_mods, when kept (see undo_close)
+        self.init_order(cities)
+        self.length = sum([self.road_length(r) for r in self])
+
+    def new(self, cities):
+        """ Return a tour of the same class and Problem going through the cities. """
+        return self.__class__(cities, self.problem)
+
+    def init_order(self, cities):
+        """ Build the doubly linked list of the cities order. """
+        n = len(cities)
+        self.neighbors = [None] * (max(cities) + 1 if n else 0)
         for i in range(n):
             self.neighbors[cities[i]] = (cities[i - 1], cities[(i + 1) % n])
-        self.length = sum([road.length for road in self])
 
     def revert(self):
         """ Reset back to the original closed tour. """
         # The sequence of cities in self.cities isn't modified
-        # during the LK modifications.
-        self.__init__(self.cities)
+        # during the LK modifications (but is out of date after close).
+        self.__init__(self.cities, self.problem)
 
     def close(self):
         """ Convert from an open path to a closed tour,
-            keeping the city sequence generated from the LK modifications. """
-        self.__init__(self.city_sequence())
+            keeping the city sequence generated from the LK modifications.
+            This is done in place by adding the road from last to first ;
+            self.cities is read again along the tour only when asked for. """
+        self.add(road(self.first, self.last))
+        self.first = self.last = None
+        self.start = None
+        self.ordered = False
 
     def find_lk_mods(self, max_search_roads, added=None, deleted=None):
         """ Return viable L.K. modifications as described in the ascii art above,
@@ -117,15 +182,30 @@ class Tour(set):
             deleted = set()
         mods = []
         cityN = self.last
+        distance = self.all_cities.distance
+        # Candidates discarded by rules 2, 4, 5 and 6, for self.stats.
+        (pruned2, pruned4, pruned5, pruned6) = (0, 0, 0, 0)
         # Of roads from cityN, look at the at shortest, most likely roads first.
-        for road_add in cityN.roads.get_by_length(max_search_roads):  # 1
-            city_insert = road_add.other(cityN)
-            if city_insert == self.prev_city(cityN): continue  # 2
-            road_delete = Tour.get_road(city_insert, self.next_city(city_insert))  # 3
-            if road_add.length >= road_delete.length: continue  # 4
-            if road_delete in added: continue  # 5
-            if road_add in deleted: continue  # 6
+        candidates = self.roads.get_by_length(cityN, max_search_roads)  # 1
+        for city_insert in candidates:
+            if city_insert == self.prev_city(cityN):  # 2
+                pruned2 += 1
+                continue
+            city_next = self.next_city(city_insert)
+            if distance(cityN, city_insert) >= distance(city_insert, city_next):  # 4
+                pruned4 += 1
+                continue
+            road_add = road(cityN, city_insert)
+            road_delete = road(city_insert, city_next)  # 3
+            if road_delete in added:  # 5
+                pruned5 += 1
+                continue
+            if road_add in deleted:  # 6
+                pruned6 += 1
+                continue
             mods.append((city_insert, road_add, road_delete))
+        if self.stats is not None:
+            self.stats.count_mods(len(candidates), len(mods), (pruned2, pruned4, pruned5, pruned6))
         return mods
 
     def tour_length(self):
@@ -134,7 +214,7 @@ class Tour(set):
         if self.is_tour():
             return self.length
         else:
-            return self.length + Tour.get_road(self.first, self.last).length
+            return self.length + self.all_cities.distance(self.first, self.last)
 
     def is_forward(self, road):
         """ Return True if road[0] => road[1] is along the path,
@@ -142,12 +222,12 @@ class Tour(set):
         # So either road[0] => road[1]   i.e. next(0) = 1
         # or road[-1] => road[0] = None / gap / None => road[1] => road[2] .
         return self.next_city(road[0]) == road[1] or \
-           self.next_city(road[0]) == None == self.prev_city(road[1])
+           self.next_city(road[0]) is None is self.prev_city(road[1])
 
     def is_tour(self):
         """ Return true if in original, Tour state,
             as opposed to the LK Path state. """
-        return not self.first and not self.last
+        return self.first is None and self.last is None
 
     def tour2path(self, road, backward=False):
         """ Convert a closed tour into an LK path by removing a road.
@@ -160,6 +240,17 @@ class Tour(set):
         else:
             (self.first, self.last) = (road[0], road[1])
         self.remove(road)
+        self.start = (road, backward)
+
+    def path2tour(self):
+        """ Undo tour2path, once the path is back to its state after it
+            (as path_search leaves it). """
+        (road, backward) = self.start
+        self.add(road)
+        self.first = self.last = None
+        self.start = None
+        if backward:
+            self.flip_direction()
 
     def replace_neighbors(self, road, (a, b)):
         """ Replace neighbors of road ends with new neighbors (a,b) """
@@ -175,13 +266,13 @@ class Tour(set):
     def add(self, road):
         """ Add a road. """
         super(Tour, self).add(road)
-        self.length += road.length
+        self.length += self.road_length(road)
         self.replace_neighbors(road, road)
 
     def remove(self, road):
         """ Remove a road. """
         super(Tour, self).remove(road)
-        self.length -= road.length
+        self.length -= self.road_length(road)
         self.replace_neighbors(road, (None, None))
 
     def flip1city(self, city):
@@ -190,17 +281,18 @@ class Tour(set):
         self.neighbors[city] = (after, before)
 
     def flip_direction(self, cityA=None, cityB=None):
-        if cityA:
+        if cityA is not None:
             city = cityA
-            while city:
+            while city is not None:
                 next_city = self.next_city(city)
                 self.flip1city(city)
                 if city == cityB:
                     break
                 city = next_city
         else:
-            for city in self.cities:
-                self.flip1city(city)
+            for city in range(len(self.neighbors)):
+                if self.neighbors[city] is not None:
+                    self.flip1city(city)
             (self.first, self.last) = (self.last, self.first)
 
     def modify(self, city_insert, road_add, road_delete):
@@ -220,7 +312,7 @@ class Tour(set):
         #   road_add     is  city[N] => city[i] (over the top);
         #   road_delete  is  city[i] => i+1
         #
-        iPlus1 = road_delete.other(city_insert)
+        iPlus1 = other(road_delete, city_insert)
         cityN = self.last
         if not road_delete in self:
             raise Exception("Oops - tried to remove %s from %s" % (str(road_delete), ",".join(map(str, self))))
@@ -233,7 +325,7 @@ class Tour(set):
         """ Undo LK path modification """
         # See the picture above; I'm using the original numbering scheme.
         iPlus1 = self.last
-        cityN = road_add.other(city_insert)
+        cityN = other(road_add, city_insert)
         if not road_add in self:
             raise Exception("Oops - tried to remove %s from set %s" % (str(road_add), ",".join(map(str, self))))
         self.remove(road_add)
@@ -241,75 +333,124 @@ class Tour(set):
         self.add(road_delete)
         self.last = cityN
 
+    def reverse_path(self, a, b):
+        """ Reverse the part of the closed tour going forward from a to b,
+            replacing the roads at both of its ends. """
+        assert self.is_tour()
+        if a == b:
+            return
+        (p, q) = (self.prev_city(a), self.next_city(b))
+        self.remove(road(p, a))
+        self.remove(road(b, q))
+        self.flip_direction(a, b)
+        self.add(road(p, b))
+        self.add(road(a, q))
+        self.ordered = False
+
+    def undo_close(self, start, first, last, mods):
+        """ Undo an entry (start, first, last, mods) of self.journal : open
+            the closed tour again between first and last, undo the modifications
+            and go back to the tour before tour2path(*start).  The entries
+            are undone from the last one, on the tour they left. """
+        assert self.is_tour()
+        self.remove(road(first, last))
+        (self.first, self.last, self.start) = (first, last, start)
+        for mod in reversed(mods):
+            self.unmodify(*mod)
+        self.path2tour()
+        self.ordered = False
+
+    def insert_city(self, city, a, b):
+        """ Put a city which is not in the closed tour
+            on the road between the neighbor cities a and b. """
+        assert self.is_tour()
+        if self.next_city(a) != b:
+            (a, b) = (b, a)
+        distance = self.all_cities.distance
+        super(Tour, self).remove(road(a, b))
+        super(Tour, self).add(road(a, city))
+        super(Tour, self).add(road(city, b))
+        self.length += distance(a, city) + distance(city, b) - distance(a, b)
+        self.link_city(city, a, b)
+        # self.cities only has to start with a city of the tour until it is read again.
+        (self.cities, self.ordered) = ([a], False)
+
+    def remove_city(self, city):
+        """ Take a city out of the closed tour, joining its previous
+            and next cities by a road ; return these two cities. """
+        assert self.is_tour()
+        if len(self) <= 3:
+            raise ValueError("A tour can't have less than 3 cities.")
+        (a, b) = (self.prev_city(city), self.next_city(city))
+        distance = self.all_cities.distance
+        super(Tour, self).remove(road(a, city))
+        super(Tour, self).remove(road(city, b))
+        super(Tour, self).add(road(a, b))
+        self.length += distance(a, b) - distance(a, city) - distance(city, b)
+        self.unlink_city(city, a, b)
+        (self.cities, self.ordered) = ([a], False)
+        return (a, b)
+
+    def link_city(self, city, a, b):
+        """ Put city between a and its next city b in the cities order. """
+        if city >= len(self.neighbors):
+            self.neighbors.extend([None] * (city + 1 - len(self.neighbors)))
+        self.neighbors[a] = (self.neighbors[a][0], city)
+        self.neighbors[city] = (a, b)
+        self.neighbors[b] = (city, self.neighbors[b][1])
+
+    def unlink_city(self, city, a, b):
+        """ Take city out of the cities order, between a and b. """
+        self.neighbors[a] = (self.neighbors[a][0], b)
+        self.neighbors[b] = (a, self.neighbors[b][1])
+        self.neighbors[city] = None
+
     def next_city(self, city):
         return self.neighbors[city][1]
 
     def prev_city(self, city):
         return self.neighbors[city][0]
 
+    def between(self, a, b, c):
+        """ Return True if b is on the path going forward from a to c. """
+        city = a
+        while city is not None:
+            if city == b:
+                return True
+            if city == c:
+                return False
+            city = self.next_city(city)
+        return False
+
     def city_sequence(self):
         """ Return the cities along the path from first to last,
             or the cities in the tour. """
-        if not self.first and not self.last:
+        if self.is_tour():
+            if not self.ordered:
+                self.cities = self.cities_from(self.cities[0])
+                self.ordered = True
             return self.cities
         else:
-            cities = []
-            city = self.first
-            while True:
-                cities.append(city)
-                if city == self.last:
-                    break
-                city = self.next_city(city)
-            return cities
-
-    def plot_cities(self):
-        """ Plot Tour cities in a figure.
-        This method is called only once as long as the figure is not closed,
-        because the cities are the same, only paths change.
-        """
-        x = []
-        y = []
-        for city in self.city_sequence():
-            x.append(city.x)
-            y.append(city.y)
-            plt.annotate(city.name, xy=(city.x, city.y), xytext=(5, 5), textcoords='offset points')
+            return self.cities_from(self.first)
 
-        plt.plot(x, y, 'co')
-
-        # Ignore matplotlib warnings related to GUI
-        warnings.filterwarnings("ignore", ".*GUI.*")
-
-    def plot_paths(self, iteration, best_iteration, block=False, end=False):
-        """Plot paths between cities plotted previously
-        """
-        cities = self.city_sequence()
-        for index in range(len(cities) - 1):
-            plt.arrow(cities[index].x, cities[index].y, (cities[index+1].x - cities[index].x),
-                      (cities[index+1].y - cities[index].y), color='r',
-                      length_includes_head=True, head_width=0, width=0.001)
-
-        if self.is_tour():
-            plt.arrow(cities[-1].x, cities[-1].y, (cities[0].x - cities[-1].x), (cities[0].y - cities[-1].y),
-                      head_width=0, color='r', length_includes_head=True, width=0.001)
-        plt.suptitle('Actual iteration : ' + str(iteration) + '/' + str(2*len(self)) +
-                     '\n Best tour found on iteration : '
-                     + str(best_iteration) + ', Tour length : ' + str(self.tour_length()), fontsize=12)
-        ax = plt.gca()
-        if end:
-            plt.text(0.5, -0.1, 'Finished, Close this window to stop the program.', horizontalalignment='center',
-                     verticalalignment='center', transform=ax.transAxes, color='green', weight='bold')
-        plt.show(block)
-        plt.pause(0.1)
-        del ax.artists[:]
+    def cities_from(self, start):
+        """ Return the cities going forward from start,
+            up to the end of the path or around the tour. """
+        cities = [start]
+        city = self.next_city(start)
+        while city is not None and city != start:
+            cities.append(city)
+            city = self.next_city(city)
+        return cities
 
     def __str__(self):
         cities_along_path = self.city_sequence()
-        names = [c.name for c in cities_along_path]
+        names = [self.all_cities.names[c] for c in cities_along_path]
         if len(names) > 8:
             names[3:-3] = ['...']
         city_string = " - ".join(names)
-        if len(self.cities) == len(self):
-            city_string += " - " + cities_along_path[0].name
+        if self.is_tour():
+            city_string += " - " + names[0]
             return "<Tour (%i roads, length %4.2f): %s>" % \
                    (len(self), self.length, city_string)
         else:
@@ -0,0 +1,82 @@
+import random
+from collections import OrderedDict
+
+
+class TranspositionTable(object):
+    """ The results of path_search for the path states already searched
+        from the current start (see lk.table_path_search), so that a state reached
+        again through the same modifications in another order is not
+        searched again.  The state of a path, whose first city is fixed,
+        is its last city with the sets of roads added and deleted.
+
+        It is keyed by a Zobrist hash, the xor of random codes of its parts,
+        updated by each modification :
+
+          self.codes[city]   = random (added, deleted, last) codes of city,
+                               a road (i, j) having the product of the codes
+                               of i and j (less than 62 bits with 31 bits codes)
+
+        At most self.size states are kept, the least recently used ones are
+        dropped first.  The counts of hits, misses and evictions are kept
+        since the table was made.
+    """
+
+    def __init__(self, size=1 << 16, seed=0):
+        self.size = size
+        self.entries = OrderedDict()
+        self.codes = []
+        self.random = random.Random(seed)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def code(self, city):
+        codes = self.codes
+        while len(codes) <= city:
+            codes.append(tuple(self.random.getrandbits(31) | 1 for kind in range(3)))
+        return codes[city]
+
+    def move_key(self, road_add, road_rm):
+        """ Return the key change of a modification adding and deleting these roads. """
+        (a, b, c, d) = (self.code(road_add[0]), self.code(road_add[1]), self.code(road_rm[0]), self.code(road_rm[1]))
+        return (a[0] * b[0]) ^ (c[1] * d[1])
+
+    def state_key(self, key, last):
+        """ Return the key of the path ending with last city, key being the
+            xor of the move_key of the modifications done from the start. """
+        return key ^ self.code(last)[2]
+
+    def start(self):
+        """ Forget the states, at the beginning of a search from a new start. """
+        self.entries.clear()
+
+    def get(self, state):
+        """ Return the result stored for the state, or None. """
+        result = self.entries.pop(state, None)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries[state] = result
+        return result
+
+    def put(self, state, result):
+        entries = self.entries
+        entries[state] = result
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def counts(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def merge(self, counts):
+        """ Add the counts() of another process. """
+        self.hits += counts['hits']
+        self.misses += counts['misses']
+        self.evictions += counts['evictions']
+
+    def summary(self):
+        searched = self.hits + self.misses
+        return "transposition table : %i hits, %i misses (%.1f%% of the path states found again), %i evictions" % \
+            (self.hits, self.misses, 100.0 * self.hits / searched if searched else 0.0, self.evictions)
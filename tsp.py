@@ -1,119 +1,258 @@
 import csv
+import sys
 import random
 import argparse
-import time
-from city import City
-from tour import Tour
-
-
-def tour_improve(tour, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
-
-    """ loop over roads ; convert tour to path
-        and then start Lin-Kernighan-ish algorithm. """
-    (best_length, best_cities) = (tour.tour_length(), tour.city_sequence())
-
-    loop_roads = set(tour)  # loop over a duplicate; tour will be modified.
-    print "===== starting tour_improve with %i paths to check" % (2 * len(loop_roads))
-    i = 0
-    best_iteration = 0
-    for road in loop_roads:
-        for backward in (True, False):
-            i += 1
-            tour.revert()
-            tour.tour2path(road, backward)
-            print "---- calling %i path_search on %s " % (i, str(tour))
-            tour2 = path_search(tour, [], [], lk_max_search_roads, lk_verbose, lk_depth_limit)
-            print "---- done path_search; found length=%f" % tour2.tour_length()
-            if tour2.tour_length() < best_length:
-                best_length = tour2.tour_length()
-                best_cities = tour2.city_sequence()
-                best_iteration = i
-            best_tour = Tour(best_cities)
-            best_tour.plot_paths(i, best_iteration)
-    print "===== finished tour_improve; best is %s " % str(best_tour)
-    return best_tour, best_iteration
-
-
-def path_search(path, added, deleted, lk_max_search_roads, lk_verbose=False, lk_depth_limit=None):
-    """ Recursive part of search for an improved TSP solution. """
-    depth = len(added)  # also = len(deleted)
-    (old_tour_length, old_cities) = (path.tour_length(), path.city_sequence())
-    results = [(old_tour_length, old_cities)]
-    mods = path.find_lk_mods(lk_max_search_roads, added, deleted)
-
-    if lk_verbose:
-        print " " * depth + "  -- path_search " + \
-              " depth=%i, path=%f, tour=%f, n_mods=%i " % \
-              (depth, path.length, old_tour_length, len(mods))
-
-    for (city, road_add, road_rm) in mods:
-
-        if lk_verbose:
-            print " " * depth + "  -> (city, road_add, road_rm) = (%s, %s, %s) " % \
-                                (str(city), str(road_add), str(road_rm))
-
-        path.modify(city, road_add, road_rm)
-
-        if lk_verbose:
-            print " " * depth + "  -> modified path %s " % str(path)
-
-        added.append(road_add)
-        deleted.append(road_rm)
-
-        if lk_depth_limit and depth > lk_depth_limit:
-            result_path = path
-        else:
-            result_path = path_search(path, list(added), list(deleted), lk_max_search_roads, lk_verbose, lk_depth_limit)
-        results.append((result_path.tour_length(), result_path.city_sequence()))
-
-        if lk_verbose:
-            print " " * depth + "  -> result path=%f; tour=%f" % \
-                                (result_path.length, result_path.tour_length())
-
-        added.pop()
-        deleted.pop()
-
-        path.unmodify(city, road_add, road_rm)
-
-    # Finished breadth search at this depth ; return best result
-    (best_length, best_city_seq) = min(results)
-    return Tour(best_city_seq)
+import signal
+from loader import load
+from candidatecache import CandidateCache
+from lk import breadth_list
+from construction import tour_builders
+from preopt import pre_optimizers
+from transposition import TranspositionTable
+from checkpoint import Checkpoint, load_checkpoint, stages as checkpoint_stages
+from stats import SearchStats
+from solver import solve, solve_defaults
+
+
+def coordinate(value):
+    """ Write integer coordinates without a decimal point, as they are read. """
+    return int(value) if value.is_integer() else value
+
+
+def write_tour(filename, cities, order):
+    """ Write the cities along the tour in csv format, like the dataset file. """
+    with open(filename, 'wb') as tourFile:
+        writer = csv.writer(tourFile, delimiter=',')
+        for city in order:
+            writer.writerow([cities.names[city], coordinate(cities.x[city]), coordinate(cities.y[city])])
+
+
+class Progress(object):
+    """ The stage of the run and the last tour seen as an observer of
+        tour_improve or IteratedLK.run, printed on SIGUSR1 (see report)
+        for the whole run, which also saves the checkpoint if given. """
+
+    # The stages of solve(), as printed.
+    stage_names = {'candidates': 'building the candidate roads', 'tiles': 'solving the tiles',
+                   'init': 'building the initial tour', 'pre_opt': 'pre-optimizing the initial tour',
+                   'lk': 'LK', 'ils': 'iterated LK'}
+
+    def __init__(self, checkpoint=None):
+        self.checkpoint = checkpoint
+        self.stage = 'reading the dataset'
+        self.last = None
+
+    def __call__(self, tour, iteration, iterations, best_iteration):
+        self.last = (iteration, iterations, best_iteration, tour.tour_length())
+
+    def start(self, stage):
+        """ The progress hook of solve(), which also gives its stage to the checkpoint. """
+        (self.stage, self.last) = (self.stage_names.get(stage, stage), None)
+        if self.checkpoint and stage in checkpoint_stages:
+            self.checkpoint.stage = stage
+
+    def report(self, signum=None, frame=None):
+        line = "===== " + self.stage
+        if self.last is not None:
+            (iteration, iterations, best_iteration, length) = self.last
+            line += " : iteration %i%s, best on iteration %i, tour length %f" % \
+                (iteration, " of %i" % iterations if iterations else "", best_iteration, length)
+        sys.stdout.write(line + "\n")
+        if self.checkpoint:
+            self.checkpoint.request(signum, frame)
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, self.report)
+
 
 parser = argparse.ArgumentParser(description='Lin Kernighan Algorithm.')
-parser.add_argument('-n', '--neighbors', type=int, default='3',
-                    help='Neighbors count to test for new roads, default 3.')
+parser.add_argument('-n', '--neighbors', type=int, default=solve_defaults['neighbors'],
+                    help='Neighbors count to test for new roads, default %(default)s.')
+parser.add_argument('-c', '--candidates', type=int, default=solve_defaults['candidates'],
+                    help='Nearest neighbors kept as candidate roads for each city, default %(default)s. '
+                         'Raised to the neighbors count if lower.')
+parser.add_argument('--candidate-type', choices=['nearest', 'alpha'], default=solve_defaults['candidate_type'],
+                    help='Candidate roads of each city : its nearest neighbors, or its alpha-nearest ones '
+                         '(LKH minimum 1-trees, fewer candidates are needed), which also give a lower bound '
+                         'of the tour length, default %(default)s.')
+parser.add_argument('--ascent-iterations', type=int, default=solve_defaults['ascent_iterations'],
+                    help='Subgradient iterations of the 1-trees penalties for the alpha candidates, '
+                         'default %(default)s.')
+parser.add_argument('--candidate-cache', default=None,
+                    help='Directory keeping the candidate roads of the datasets already seen, '
+                         'so that running them again skips computing them.')
+parser.add_argument('--candidate-cache-size', type=int, default=1024,
+                    help='Size in MB above which the least recently used candidates are removed '
+                         'from the cache directory, default 1024.')
 parser.add_argument('-f', '--file', default='dataset.csv',
-                    help='Dataset input file in csv format, if not given will look for the file \'dataset.csv\'.')
+                    help='Dataset input file in csv (name,x,y rows) or TSPLIB format '
+                         '(EUC_2D, CEIL_2D, GEO or ATT distances), '
+                         'if not given will look for the file \'dataset.csv\'.')
+parser.add_argument('--cache', choices=['auto', 'yes', 'no'], default='auto',
+                    help='Keep the parsed cities in a memory-mapped file next to the dataset, '
+                         'read instead of the dataset on the next runs ; by default only for files of 1 MB or more.')
 parser.add_argument('-d', '--depth', type=int, default=None,
                     help='Depth of search, if given transform the algorithm into a fixed lambda-opt search.')
+parser.add_argument('--transpositions', type=int, default=solve_defaults['transpositions'],
+                    help='Keep the results of up to this many path states in a transposition table, '
+                         'so that the recursive search does not search again a state reached by another order '
+                         'of the same modifications ; default %(default)s, no table.')
+parser.add_argument('--search', choices=['recursive', 'iterative'], default=solve_defaults['search'],
+                    help='Path search : the recursive path_search, or its iterative version with a breadth per depth '
+                         'and first-improvement acceptance ; default %(default)s.')
+parser.add_argument('--breadth', type=breadth_list, default=None,
+                    help='Modifications tried at each depth by the iterative search, as 5,5,3,2,1, '
+                         'the last one for the deeper levels ; default all of them.')
+parser.add_argument('--first-improvement', action='store_true',
+                    help='Stop the iterative search at the first modification improving the tour, '
+                         'instead of keeping the best one found.')
+parser.add_argument('-b', '--backend', choices=['linked', 'array'], default=solve_defaults['backend'],
+                    help='Tour order storage : linked (dictionary of neighbors) or array '
+                         '(two-level list, faster on large datasets), default %(default)s.')
+parser.add_argument('-i', '--init', choices=sorted(tour_builders), default=solve_defaults['init'],
+                    help='Heuristic building the initial tour from the candidate roads, default %(default)s ; '
+                         'greedy is much faster on large datasets, but LK improves it less.')
+parser.add_argument('--pre-opt', choices=sorted(pre_optimizers), default=None,
+                    help='Improve the initial tour with NumPy vectorized 2-opt and/or Or-opt moves '
+                         'before the LK search.')
+parser.add_argument('--tile-size', type=int, default=None,
+                    help='Split the cities in tiles of at most this many cities, solve their tours separately '
+                         '(on the workers) and join them, then run LK only along the seams ; '
+                         'for very large datasets.')
+parser.add_argument('-w', '--workers', type=int, default=None,
+                    help='Run the path searches in rounds on this many processes (the tour found does not depend '
+                         'on their number) ; by default they are run one at a time in this process.')
+parser.add_argument('-t', '--time-limit', type=float, default=None,
+                    help='Time in seconds to spend improving the tour with the first LK pass and the '
+                         'iterated LK kicks after it, in all ; counted again from 0 on --resume.')
+parser.add_argument('-m', '--max-trials', type=int, default=None,
+                    help='Maximum number of iterated LK kicks, after the first LK pass.')
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='Seed of the random generator, for repeatable runs.')
+parser.add_argument('--checkpoint', default=None,
+                    help='Binary file to save the best tour, the iteration and the random generator state to, '
+                         'every --checkpoint-interval seconds, at the end, and on SIGUSR1 or SIGTERM '
+                         '(which then stops the run).')
+parser.add_argument('--checkpoint-interval', type=float, default=60.0,
+                    help='Seconds between two checkpoints, default 60.')
+parser.add_argument('--resume', action='store_true',
+                    help='Start from the tour of the --checkpoint file instead of building one : '
+                         'the LK pass is done again from all the cities if it was not finished, '
+                         'else the iterated LK trials go on.')
+parser.add_argument('--headless', action='store_true',
+                    help='Run without plotting nor prompts, writing the final tour to the output file.')
+parser.add_argument('-o', '--output', default=None,
+                    help='File to write the final tour to in csv format, '
+                         'default \'tour.csv\' in headless mode.')
+parser.add_argument('-p', '--plot-interval', type=float, default=1.0,
+                    help='Minimum time in seconds between two redraws of the tour, default 1.')
+parser.add_argument('--stats', action='store_true',
+                    help='Count the path_search nodes, find_lk_mods pruning, flips time and gains, '
+                         'and print a summary at the end.')
+parser.add_argument('--stats-file', default=None,
+                    help='File to write the search statistics to in json format (implies --stats).')
+parser.add_argument('--profile', choices=['cprofile', 'sampling'], default=None,
+                    help='Profile tour_improve with cProfile (written to tsp.prof) '
+                         'or with a low overhead sampling profiler.')
 parser.add_argument('-v', '--verbose', action='store_true',
                     help='Print detailed information about road search.')
-args = parser.parse_args()
-cmdopt = vars(args)
-neighbors = cmdopt.get('neighbors')
-dsfile = cmdopt.get('file')
-depth = cmdopt.get('depth')
-verbose = cmdopt.get('verbose')
-
-cities = []
-with open(dsfile) as datasetFile:
-    dataset = csv.reader(datasetFile, delimiter=',')
-    for row in dataset:
-        cities.append(City(row[0], int(row[1]), int(row[2])))
-random.shuffle(cities)
-Tour.init_roads(cities)
-tour = Tour(cities)
-answer = 'Y'
-while answer in ['Yes', 'yes', 'YES', 'y', 'Y']:
-    tour.plot_cities()
-    begin = time.time()
-    tour, iteration = tour_improve(tour, neighbors, verbose, depth)
-    end = time.time()
-    duration = end - begin
-    print "Iterations took ", duration, " seconds."
-    tour.plot_paths(2 * len(tour), iteration, True, True)
-    answer = raw_input("Try to improve this tour ? [Y/N] (default No) : ")
-    if answer in ['Yes', 'yes', 'YES', 'y', 'Y']:
-        neighbors_in = raw_input("Set a new value for neighbors count (default = actual = " + str(neighbors) + ') : ')
-        if neighbors_in:
-            neighbors = int(neighbors_in)
+
+
+def main():
+    args = parser.parse_args()
+    if args.headless and not args.output:
+        args.output = 'tour.csv'
+    checkpoint = None
+    if args.checkpoint:
+        checkpoint = Checkpoint(args.checkpoint, args.checkpoint_interval)
+        checkpoint.install()
+    elif args.resume:
+        parser.error("--resume needs the --checkpoint file.")
+    # Installed before the first long stage, so that SIGUSR1 never stops the run.
+    progress = Progress(checkpoint)
+    progress.install()
+    if args.search == 'iterative':
+        if args.transpositions:
+            parser.error("--transpositions only applies to --search recursive.")
+    elif args.breadth or args.first_improvement:
+        parser.error("--breadth and --first-improvement need --search iterative.")
+
+    random.seed(args.seed)
+    cities = load(args.file, {'auto': None, 'yes': True, 'no': False}[args.cache])
+    candidate_cache = None
+    if args.candidate_cache:
+        candidate_cache = CandidateCache(args.candidate_cache, args.candidate_cache_size << 20)
+    options = dict(neighbors=args.neighbors, candidates=args.candidates, candidate_type=args.candidate_type,
+                   ascent_iterations=args.ascent_iterations, candidate_cache=candidate_cache, init=args.init,
+                   pre_opt=args.pre_opt, backend=args.backend, depth=args.depth, time_limit=args.time_limit,
+                   max_trials=args.max_trials, workers=args.workers, stats=args.stats or bool(args.stats_file),
+                   tile_size=args.tile_size, transpositions=args.transpositions, search=args.search,
+                   breadth=args.breadth, first_improvement=args.first_improvement, progress=progress.start,
+                   verbose=args.verbose, profile=args.profile, quiet=False, interruptible=True)
+    # The first tour is built by solve(), or is the one of the checkpoint : its LK pass
+    # is done again from all the cities, or the iterated LK goes on.
+    if args.resume:
+        state = load_checkpoint(checkpoint.filename)
+        if len(state['order']) != len(cities):
+            parser.error("The checkpoint has %i cities, the dataset %i." % (len(state['order']), len(cities)))
+        random.setstate(state['rng_state'])
+        print "Resumed from %s : %s stage, iteration %i, tour length : %f" % \
+            (checkpoint.filename, state['stage'], state['iteration'], state['length'])
+        options['order'] = state['order']
+        if state['stage'] == 'ils':
+            options.update(start_cities=[], trials=state['iteration'], best_trial=state['best_iteration'])
+            # Saved again as they are if no trial is done.
+            (checkpoint.stage, checkpoint.iteration, checkpoint.best_iteration) = \
+                ('ils', state['iteration'], state['best_iteration'])
+    if args.headless:
+        observer = progress
+    else:
+        # Imported only here, so that headless runs don't need matplotlib.
+        from plot import TourPlot
+        plot = TourPlot(cities, args.plot_interval)
+
+        def observer(*observed):
+            progress(*observed)
+            plot(*observed)
+    result = run(cities, options, observer, checkpoint)
+    if not args.headless:
+        plot.finish(result['order'], result['length'])
+        neighbors = args.neighbors
+        while raw_input("Try to improve this tour ? [Y/N] (default No) : ") in ['Yes', 'yes', 'YES', 'y', 'Y']:
+            neighbors_in = raw_input("Set a new value for neighbors count (default = actual = " + str(neighbors) +
+                                     ') : ')
+            if neighbors_in:
+                neighbors = int(neighbors_in)
+            plot = TourPlot(cities, args.plot_interval)
+            options.update(order=result['order'], neighbors=neighbors, start_cities=None, trials=0, best_trial=0)
+            result = run(cities, options, observer, checkpoint)
+            plot.finish(result['order'], result['length'])
+    if checkpoint:
+        checkpoint.finish(result['order'], result['length'])
+    if 'transpositions' in result:
+        table = TranspositionTable(args.transpositions)
+        table.merge(result['transpositions'])
+        print table.summary()
+    if 'stats' in result:
+        search_stats = SearchStats()
+        search_stats.merge(result['stats'])
+        print search_stats.summary()
+        if args.stats_file:
+            search_stats.dump(args.stats_file)
+    if result['lower_bound']:
+        print "Tour length : %f, %.3f%% above the lower bound." % \
+            (result['length'], 100.0 * (result['length'] / result['lower_bound'] - 1))
+    if args.output:
+        write_tour(args.output, cities, result['order'])
+
+
+def run(cities, options, observer, checkpoint):
+    """ Solve the cities with the options and print the time of the LK stages. """
+    result = solve(cities, observer=checkpoint.chain(observer) if checkpoint else observer, **options)
+    times = result['times']
+    print "Iterations took ", times.get('lk', 0) + times.get('ils', 0), " seconds."
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import math
+
+
+class Segment(object):
+    """ A piece of a two-level list : a list of cities,
+        to be read backward when self.reversed is set. """
+
+    __slots__ = ('cities', 'reversed', 'rank', 'offset')
+
+    def __init__(self, cities):
+        self.cities = cities
+        self.reversed = False
+        self.rank = 0    # index in TwoLevelList.segments
+        self.offset = 0  # position of its first city in the whole order
+
+    def first(self):
+        return self.cities[-1] if self.reversed else self.cities[0]
+
+    def last(self):
+        return self.cities[0] if self.reversed else self.cities[-1]
+
+    def ordered(self):
+        """ Return the cities in their reading order. """
+        return self.cities[::-1] if self.reversed else list(self.cities)
+
+
+class TwoLevelList(object):
+    """ A cyclic sequence of N cities (usually 0 to N-1), split in about sqrt(N) segments
+        of about sqrt(N) cities each :
+
+          self.segments           = the segments, in order
+          self.segment_of[city]   = segment holding city
+          self.index_of[city]     = index of city in segment.cities
+
+        Reversing a whole segment only toggles its reversed flag,
+        so reversing any part of the sequence costs O(sqrt(N)) :
+        split the segments at both ends of the part, reverse the order
+        of the segments in between and toggle their flags.
+
+        Reversing a part of a cycle gives the same cycle as reversing
+        the rest of it and reading everything backward.  So only the
+        shorter side is ever reversed, the global self.reversed flag
+        telling in which direction the whole sequence is read.
+    """
+
+    def __init__(self, cities):
+        self.n = len(cities)
+        self.group_size = max(8, int(math.sqrt(self.n)))
+        self.reversed = False
+        self._build(list(cities))
+
+    def _build(self, cities):
+        size = max(cities) + 1 if cities else 0
+        self.segment_of = [None] * size
+        self.index_of = [0] * size
+        self.segments = [Segment(cities[start:start + self.group_size])
+                         for start in range(0, self.n, self.group_size)]
+        for segment in self.segments:
+            self._index(segment)
+        self._renumber(0)
+
+    def _index(self, segment, start=0, end=None):
+        """ Update the lookups of the segment cities from index start to end. """
+        cities = segment.cities
+        if end is None:
+            end = len(cities) - 1
+        for k in range(start, end + 1):
+            self.segment_of[cities[k]] = segment
+            self.index_of[cities[k]] = k
+
+    def _renumber(self, start):
+        """ Update rank and offset of the segments from rank start on. """
+        if start == 0:
+            offset = 0
+        else:
+            previous = self.segments[start - 1]
+            offset = previous.offset + len(previous.cities)
+        for rank in range(start, len(self.segments)):
+            segment = self.segments[rank]
+            segment.rank = rank
+            segment.offset = offset
+            offset += len(segment.cities)
+
+    def _position(self, city):
+        """ Position of city in the sequence, ignoring self.reversed. """
+        segment = self.segment_of[city]
+        k = self.index_of[city]
+        return segment.offset + (len(segment.cities) - 1 - k if segment.reversed else k)
+
+    def _succ(self, city):
+        """ Next city, ignoring self.reversed. """
+        segment = self.segment_of[city]
+        k = self.index_of[city] + (-1 if segment.reversed else 1)
+        if 0 <= k < len(segment.cities):
+            return segment.cities[k]
+        return self.segments[(segment.rank + 1) % len(self.segments)].first()
+
+    def _pred(self, city):
+        """ Previous city, ignoring self.reversed. """
+        segment = self.segment_of[city]
+        k = self.index_of[city] + (1 if segment.reversed else -1)
+        if 0 <= k < len(segment.cities):
+            return segment.cities[k]
+        return self.segments[segment.rank - 1].last()
+
+    def next(self, city):
+        return self._pred(city) if self.reversed else self._succ(city)
+
+    def prev(self, city):
+        return self._succ(city) if self.reversed else self._pred(city)
+
+    def between(self, a, b, c):
+        """ Return True if b is on the forward path from a to c. """
+        if self.reversed:
+            (a, c) = (c, a)
+        (pa, pb, pc) = (self._position(a), self._position(b), self._position(c))
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    def sequence(self, start):
+        """ Return all the cities in forward order, beginning with start. """
+        cities = []
+        for segment in self.segments:
+            cities.extend(segment.ordered())
+        p = self._position(start)
+        if self.reversed:
+            cities.reverse()
+            p = self.n - 1 - p
+        return cities[p:] + cities[:p]
+
+    def flip(self):
+        """ Read the whole sequence backward. """
+        self.reversed = not self.reversed
+
+    def reverse(self, a, b):
+        """ Reverse the forward path from a to b. """
+        if self.reversed:
+            # Read forward, a to b is b to a in the segments order.
+            (a, b) = (b, a)
+        length = (self._position(b) - self._position(a)) % self.n + 1
+        if 2 * length > self.n:
+            self.flip()
+            if length == self.n:
+                return
+            (a, b) = (self._succ(b), self._pred(a))
+        self._reverse(a, b)
+
+    def _reverse(self, a, b):
+        """ Reverse the path from a to b, in the segments order. """
+        segment = self.segment_of[a]
+        if segment is self.segment_of[b] and self._position(a) <= self._position(b):
+            (ka, kb) = sorted((self.index_of[a], self.index_of[b]))
+            segment.cities[ka:kb + 1] = segment.cities[ka:kb + 1][::-1]
+            self._index(segment, ka, kb)
+            return
+        self._split_before(a)
+        self._split_before(self._succ(b))
+        (ra, rb) = (self.segment_of[a].rank, self.segment_of[b].rank)
+        if ra > rb:
+            # The path wraps around the end of the list ; rotate the list,
+            # which does not change the cyclic sequence.
+            self.segments = self.segments[ra:] + self.segments[:ra]
+            self._renumber(0)
+            (ra, rb) = (0, rb + len(self.segments) - ra)
+        reversed_segments = self.segments[ra:rb + 1][::-1]
+        for segment in reversed_segments:
+            segment.reversed = not segment.reversed
+        self.segments[ra:rb + 1] = reversed_segments
+        self._renumber(ra)
+        self._merge(rb)
+        self._merge(ra - 1)
+        if len(self.segments) > 4 * (self.n // self.group_size + 1):
+            self._rebuild()
+
+    def insert(self, city, a):
+        """ Put a new city just after a, going forward. """
+        if city >= len(self.segment_of):
+            self.segment_of.extend([None] * (city + 1 - len(self.segment_of)))
+            self.index_of.extend([0] * (city + 1 - len(self.index_of)))
+        segment = self.segment_of[a]
+        k = self.index_of[a]
+        # Going forward reads the cities list of the segment
+        # in its order when both flags are equal.
+        if segment.reversed == self.reversed:
+            k += 1
+        segment.cities.insert(k, city)
+        self._index(segment, k)
+        self.n += 1
+        self._renumber(segment.rank)
+        if len(segment.cities) > 2 * self.group_size:
+            self._split_before(segment.cities[len(segment.cities) // 2])
+
+    def remove(self, city):
+        """ Take a city out of the sequence. """
+        segment = self.segment_of[city]
+        k = self.index_of[city]
+        del segment.cities[k]
+        self.segment_of[city] = None
+        self.n -= 1
+        if segment.cities:
+            self._index(segment, k)
+        else:
+            del self.segments[segment.rank]
+        self._renumber(min(segment.rank, len(self.segments) - 1))
+
+    def _split_before(self, city):
+        """ Split the segment of city so that city becomes its first one. """
+        segment = self.segment_of[city]
+        if segment.first() == city:
+            return
+        if segment.reversed:
+            segment.cities.reverse()
+            segment.reversed = False
+            self._index(segment)
+        k = self.index_of[city]
+        tail = Segment(segment.cities[k:])
+        del segment.cities[k:]
+        self.segments.insert(segment.rank + 1, tail)
+        self._index(tail)
+        self._renumber(segment.rank)
+
+    def _merge(self, rank):
+        """ Merge the segments at rank and rank + 1 if they are small enough. """
+        if rank < 0 or rank + 1 >= len(self.segments):
+            return
+        (segment, following) = self.segments[rank:rank + 2]
+        if len(segment.cities) + len(following.cities) > self.group_size:
+            return
+        segment.cities = segment.ordered() + following.ordered()
+        segment.reversed = False
+        self._index(segment)
+        del self.segments[rank + 1]
+        self._renumber(rank)
+
+    def _rebuild(self):
+        """ Split the sequence again in segments of equal sizes. """
+        cities = []
+        for segment in self.segments:
+            cities.extend(segment.ordered())
+        self._build(cities)